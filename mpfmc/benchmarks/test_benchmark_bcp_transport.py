@@ -0,0 +1,106 @@
+import os
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from mpfmc.core.bcp_server import BCPServer
+
+
+class BenchmarkBcpTransport(unittest.TestCase):
+
+    """Compare TCP and unix domain sockets for BCP on the loopback."""
+
+    def _start_server(self, interface):
+        mc = MagicMock()
+        mc.thread_stopper = threading.Event()
+        mc.crash_queue = queue.Queue()
+        mc.options = {'production': False}
+        mc.machine_config = {'mpf-mc': {'bcp_interface': interface,
+                                        'bcp_port': 0,
+                                        'bcp_max_clients': 1,
+                                        'bcp_client_queue_size': 1000,
+                                        'bcp_max_message_size': 1048576,
+                                        'bcp_primary_controller': 'Mission Pinball Framework'}}
+        receive_queue = queue.Queue()
+        sending_queue = queue.Queue()
+        server = BCPServer(mc, receive_queue, sending_queue)
+        server.daemon = True
+        server.start()
+
+        if interface.startswith('unix:'):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(interface[5:])
+        else:
+            client = socket.create_connection(server.socket.getsockname()[:2])
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        while receive_queue.get(timeout=5)[1].get('name') != 'client_connected':
+            pass
+
+        self.addCleanup(mc.thread_stopper.set)
+        self.addCleanup(client.close)
+        return client, receive_queue, sending_queue
+
+    @staticmethod
+    def _receive(client, length):
+        received = 0
+        while received < length:
+            received += len(client.recv(min(length - received, 1 << 20)))
+
+    def _benchmark_send(self, name, client, sending_queue, msg, rawbytes, num):
+        """Throughput from MC to the client."""
+        length = len(msg) + 1
+        if rawbytes:
+            length += len('&bytes={}'.format(len(rawbytes))) + len(rawbytes)
+
+        start = time.perf_counter()
+        for _ in range(num):
+            sending_queue.put((msg, rawbytes))
+        self._receive(client, length * num)
+        duration = time.perf_counter() - start
+        print("{}: {} messages in {:.2f}ms  Messages per second: {:.0f}  MB per second: {:.1f}".format(
+            name, num, duration * 1000, num / duration, length * num / duration / 1e6))
+
+    def _benchmark_latency(self, name, client, receive_queue, sending_queue, msg, rawbytes, num):
+        """Round trip of one message from MC to the client and one back."""
+        length = len(msg) + 1
+        if rawbytes:
+            length += len('&bytes={}'.format(len(rawbytes))) + len(rawbytes)
+
+        latencies = []
+        for _ in range(num):
+            start = time.perf_counter()
+            sending_queue.put((msg, rawbytes))
+            self._receive(client, length)
+            client.sendall(b'trigger?name=ack\n')
+            receive_queue.get(timeout=5)
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        print("{}: Round trip median {:.3f}ms  99th percentile {:.3f}ms".format(
+            name, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * .99)] * 1000))
+
+    def _run(self, transport, interface):
+        client, receive_queue, sending_queue = self._start_server(interface)
+        # 128x32 DMD frame and RGB DMD frame
+        for message_name, msg, rawbytes in (('trigger', 'trigger?name=light_show_step', None),
+                                            ('dmd_frame', 'dmd_frame?name=dmd', os.urandom(128 * 32)),
+                                            ('rgb_dmd_frame', 'rgb_dmd_frame?name=dmd', os.urandom(128 * 32 * 3))):
+            self._benchmark_send("{} {} throughput".format(transport, message_name), client, sending_queue,
+                                 msg, rawbytes, 10000)
+            self._benchmark_latency("{} {} latency".format(transport, message_name), client, receive_queue,
+                                    sending_queue, msg, rawbytes, 1000)
+
+    def testTcp(self):
+        self._run("TCP", "localhost")
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "No unix domain sockets on this platform")
+    def testUnixSocket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self._run("UDS", "unix:" + os.path.join(directory, "bcp.sock"))
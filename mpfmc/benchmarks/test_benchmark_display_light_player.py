@@ -0,0 +1,65 @@
+import os
+import random
+import time
+import unittest
+
+from mpfmc.config_players.display_light_player import LightMapSampler
+
+
+def _sample_per_light(data, light_map, width, height, last_color):
+    """Reference implementation which calculates the offset of every light on every frame."""
+    values = {}
+    for x, y, name in light_map:
+        x_pixel = int(x * width)
+        y_pixel = height - int(y * height)
+        if (data[width * y_pixel * 4 + x_pixel * 4 + 3]) == 0:
+            # pixel is transparent
+            value = -1
+        else:
+            value = (
+                data[width * y_pixel * 4 + x_pixel * 4],
+                data[width * y_pixel * 4 + x_pixel * 4 + 1],
+                data[width * y_pixel * 4 + x_pixel * 4 + 2])
+
+        if name not in last_color or last_color[name] != value:
+            last_color[name] = value
+            values[name] = value
+
+    return values
+
+
+class BenchmarkDisplayLightPlayer(unittest.TestCase):
+
+    def _output(self, name, start, end, num):
+        print("{}: Duration per frame {:.5f}ms  Frames per second: {:2f}".format(
+            name,
+            (1000 * (end - start) / num),
+            num / (end - start)
+        ))
+
+    def _benchmark(self, function, frames, name):
+        start = time.time()
+        for frame in frames:
+            function(frame)
+        end = time.time()
+        self._output(name, start, end, len(frames))
+        return (end - start) / len(frames)
+
+    def testSampleLights(self):
+        width = 800
+        height = 600
+        frames = [memoryview(os.urandom(width * height * 4)) for _ in range(10)]
+
+        for lights in (100, 1000, 5000):
+            light_map = [(random.uniform(0.01, 0.99), random.uniform(0.01, 0.99), "light_{}".format(i))
+                         for i in range(lights)]
+            sampler = LightMapSampler(light_map, width, height)
+            last_color = {}
+
+            self.assertEqual(_sample_per_light(frames[0], light_map, width, height, last_color),
+                             sampler.sample(frames[0]))
+
+            before = self._benchmark(lambda frame: _sample_per_light(frame, light_map, width, height, last_color),
+                                     frames, "per light {} lights".format(lights))
+            after = self._benchmark(sampler.sample, frames, "precomputed {} lights".format(lights))
+            self.assertLess(after, before)
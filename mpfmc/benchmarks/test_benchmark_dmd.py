@@ -0,0 +1,55 @@
+import os
+import struct
+import time
+import unittest
+
+from mpfmc.core.dmd import RgbDmd
+
+
+def _reorder_channels_per_pixel(data, order):
+    """Reference implementation which reorders one byte at a time."""
+    new_data = bytearray()
+    for r, g, b in struct.iter_unpack('BBB', data):
+        for channel in order:
+            if channel == "r":
+                new_data.append(r)
+            elif channel == "g":
+                new_data.append(g)
+            elif channel == "b":
+                new_data.append(b)
+            else:
+                raise ValueError("Unknown channel {}".format(channel))
+
+    return bytes(new_data)
+
+
+class BenchmarkDmd(unittest.TestCase):
+
+    def _output(self, name, start, end, num):
+        print("{}: Duration per frame {:.5f}ms  Frames per second: {:2f}".format(
+            name,
+            (1000 * (end - start) / num),
+            num / (end - start)
+        ))
+
+    def _benchmark(self, function, name, num=100):
+        start = time.time()
+        for _ in range(num):
+            function()
+        end = time.time()
+        self._output(name, start, end, num)
+        return (end - start) / num
+
+    def testReorderChannels(self):
+        for width, height in ((128, 32), (128, 128)):
+            data = os.urandom(width * height * 3)
+            channel_map = RgbDmd._build_channel_map("bgr")
+
+            self.assertEqual(_reorder_channels_per_pixel(data, "bgr"),
+                             RgbDmd._reorder_channels(data, channel_map))
+
+            before = self._benchmark(lambda: _reorder_channels_per_pixel(data, "bgr"),
+                                     "reorder per pixel {}x{}".format(width, height), num=20)
+            after = self._benchmark(lambda: RgbDmd._reorder_channels(data, channel_map),
+                                    "reorder strided {}x{}".format(width, height))
+            self.assertLess(after, before)
@@ -0,0 +1,51 @@
+import time
+
+from mpfmc.core.dmd import Dmd
+from mpfmc.tests.MpfMcTestCase import MpfMcTestCase
+
+
+class BenchmarkDmdRender(MpfMcTestCase):
+
+    def get_machine_path(self):
+        return 'benchmarks/machine_files/dmd'
+
+    def get_config_file(self):
+        return 'benchmark_dmd.yaml'
+
+    def _count_event(self, *args):
+        del args
+        self._tree_events += 1
+
+    def _create_dmd(self, persistent_render):
+        return Dmd(self.mc, "benchmark", dict(source_display="dmd", persistent_render=persistent_render))
+
+    def _benchmark(self, dmd, name, num=300):
+        display = self.mc.displays["dmd"]
+        self._tree_events = 0
+        display.fbind('parent', self._count_event)
+        display.container.fbind('parent', self._count_event)
+        dmd.effect_widget.fbind('children', self._count_event)
+
+        start = time.time()
+        for _ in range(num):
+            dmd._dirty = True
+            dmd._render(0)
+        end = time.time()
+
+        display.funbind('parent', self._count_event)
+        display.container.funbind('parent', self._count_event)
+        dmd.effect_widget.funbind('children', self._count_event)
+
+        print("{}: Duration per frame {:.5f}ms  Widget tree events per frame: {:.1f} "
+              "Widget tree events per second at 60fps: {:.0f}".format(
+                  name, 1000 * (end - start) / num, self._tree_events / num, 60 * self._tree_events / num))
+        return self._tree_events
+
+    def testPersistentRender(self):
+        self.mc.events.post("show_dmd_slide")
+        self.advance_time(.5)
+
+        before = self._benchmark(self._create_dmd(False), "detach/reattach")
+        after = self._benchmark(self._create_dmd(True), "persistent render")
+        self.assertEqual(0, after)
+        self.assertLess(after, before)
@@ -148,10 +148,28 @@ class Command:
         parser.add_argument("--no-sound",
                             action="store_true", dest="no_sound", default=False)
 
+        parser.add_argument("--bcp-record",
+                            action="store", dest="bcp_record", default=None, metavar="file",
+                            help="Record all received BCP commands to a binary log")
+
+        parser.add_argument("--bcp-replay",
+                            action="store", dest="bcp_replay", default=None, metavar="file",
+                            help="Replay a log written with --bcp-record instead of connecting "
+                                 "to MPF. Reports frame time and latency stats at the end")
+
+        parser.add_argument("--bcp-replay-speed",
+                            action="store", dest="bcp_replay_speed", default=1.0, type=float,
+                            metavar="factor",
+                            help="Speed up the replay by this factor (default 1.0)")
+
         args = parser.parse_args(args)
 
         args.configfile = Util.string_to_event_list(args.configfile)
 
+        if args.bcp_replay:
+            # the replay takes the place of MPF
+            args.bcp = False
+
         # Configure logging. Creates a logfile and logs to the console.
         # Formatting options are documented here:
         # https://docs.python.org/2.7/library/logging.html#logrecord-attributes
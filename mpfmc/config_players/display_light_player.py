@@ -1,14 +1,183 @@
 from functools import partial
 
-from kivy.graphics.instructions import Callback
-from kivy.uix.relativelayout import RelativeLayout
-
 from kivy.clock import Clock
-from kivy.graphics.fbo import Fbo
-from kivy.graphics.opengl import glReadPixels, GL_RGBA, GL_UNSIGNED_BYTE
-from kivy.graphics.texture import Texture
 
 from mpfmc.core.bcp_config_player import BcpConfigPlayer
+from mpfmc.core.display_light_encoding import encode_light_batch
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MYPY = False
+if MYPY:   # pragma: no cover
+    from mpfmc.core.display_capture import DisplayCapture
+
+
+class LightMapSampler:
+
+    """Samples the pixels of all lights in a light map from a RGBA frame.
+
+    Buffer offsets are calculated once for the size of the display and
+    recalculated only when the captured region changes. Only lights which
+    changed since the last sample are returned.
+
+    Args:
+        light_map: List of (x, y, name) tuples with x and y between 0 and 1.
+        width: Width of the display in pixels.
+        height: Height of the display in pixels.
+    """
+
+    __slots__ = ["names", "offsets", "region", "_pixels", "_index", "_last_values"]
+
+    def __init__(self, light_map, width, height):
+        """Initialise sampler."""
+        self.names = [name for _, _, name in light_map]
+        self._pixels = [(min(int(x * width), width - 1), min(height - int(y * height), height - 1))
+                        for x, y, _ in light_map]
+        self.region = None
+        self.offsets = None
+        self._index = None
+        self._last_values = None if numpy is not None else [None] * len(self.names)
+        self.set_region((0, 0, width, height))
+
+    @property
+    def bounding_box(self):
+        """Return the smallest region (x, y, width, height) which contains all lights."""
+        if not self._pixels:
+            return 0, 0, 1, 1
+        left = min(x for x, _ in self._pixels)
+        bottom = min(y for _, y in self._pixels)
+        right = max(x for x, _ in self._pixels)
+        top = max(y for _, y in self._pixels)
+        return left, bottom, right - left + 1, top - bottom + 1
+
+    def set_region(self, region):
+        """Set the region (x, y, width, height) of the display which frames contain."""
+        if region == self.region:
+            return
+
+        self.region = region
+        left, bottom, width, _ = region
+        offsets = [(width * (y - bottom) + x - left) * 4 for x, y in self._pixels]
+
+        if numpy is not None:
+            self.offsets = numpy.array(offsets, dtype=numpy.intp)
+            # offsets of all four channels of every light
+            self._index = self.offsets[:, None] + numpy.arange(4)
+        else:
+            self.offsets = offsets
+
+    def sample(self, frame) -> dict:
+        """Return a dict with the new value of all lights which changed.
+
+        The value is a RGB tuple or -1 if the pixel is transparent.
+        """
+        return {self.names[index]: value for index, value in self.sample_changes(frame)}
+
+    def sample_changes(self, frame) -> list:
+        """Return a list of (index, value) tuples for all lights which changed.
+
+        Index is the position of the light in the light map.
+        """
+        if numpy is not None:
+            return self._sample_vectorized(frame)
+
+        return self._sample_loop(frame)
+
+    def _sample_vectorized(self, frame) -> list:
+        pixels = numpy.frombuffer(frame, dtype=numpy.uint8)[self._index]
+        # normalise transparent pixels so they compare equal regardless of their color
+        transparent = pixels[:, 3] == 0
+        pixels[transparent] = 0
+        pixels[:, 3] = transparent
+
+        if self._last_values is None:
+            changed = numpy.arange(len(self.names))
+        else:
+            changed = numpy.flatnonzero(numpy.any(pixels != self._last_values, axis=1))
+        self._last_values = pixels
+
+        changes = []
+        for index in changed.tolist():
+            if transparent[index]:
+                changes.append((index, -1))
+            else:
+                changes.append((index, tuple(pixels[index, :3].tolist())))
+
+        return changes
+
+    def _sample_loop(self, frame) -> list:
+        changes = []
+        for index, offset in enumerate(self.offsets):
+            if frame[offset + 3] == 0:
+                # pixel is transparent
+                value = -1
+            else:
+                value = (frame[offset], frame[offset + 1], frame[offset + 2])
+
+            if self._last_values[index] != value:
+                self._last_values[index] = value
+                changes.append((index, value))
+
+        return changes
+
+
+class DisplayLightInstance:
+
+    """State of one display_light_player element in a context.
+
+    The instance is subscribed to the capture of its display while it is
+    active. A frame is only sampled when the capture delivered a new one
+    since the last render (which marks the instance dirty).
+
+    Args:
+        capture: The capture of the display.
+        region: Region of the display which is needed or None for all.
+        sampler: Sampler for the light map of this element.
+    """
+
+    __slots__ = ["capture", "region", "sampler", "callback", "active", "dirty", "first", "frame"]
+
+    def __init__(self, capture: "DisplayCapture", region, sampler: LightMapSampler) -> None:
+        """Initialise instance."""
+        self.capture = capture
+        self.region = region
+        self.sampler = sampler
+        self.callback = None
+        self.active = False
+        self.dirty = False
+        self.first = True
+        self.frame = None
+
+    def activate(self) -> None:
+        """Subscribe to the capture."""
+        if not self.active:
+            self.active = True
+            self.capture.subscribe(self.callback, self.region)
+
+    def deactivate(self) -> None:
+        """Unsubscribe from the capture. An inactive display is not read back."""
+        if self.active:
+            self.active = False
+            self.dirty = False
+            self.frame = None
+            self.capture.unsubscribe(self.callback)
+
+    def render(self):
+        """Return the changed lights or None if there are no changes to send."""
+        self.dirty = False
+        if self.frame is None:
+            # display has not been captured yet
+            return None
+
+        if self.first:
+            # for some reasons we got garbage in the first buffer. we just skip it for now
+            self.first = False
+            return None
+
+        return self.sampler.sample_changes(self.frame)
 
 
 class McDisplayLightPlayer(BcpConfigPlayer):
@@ -22,126 +191,77 @@ class McDisplayLightPlayer(BcpConfigPlayer):
     def __init__(self, machine):
         super().__init__(machine)
         self._scheduled = False
-        self._last_color = {}
 
     # pylint: disable-msg=too-many-arguments
     def play_element(self, settings, element, context, calling_context, priority=0, **kwargs):
         context_dict = self._get_instance_dict(context)
         if settings['action'] == "play":
-            if not self._scheduled:
-                self._scheduled = True
-                Clock.schedule_interval(self._tick, 0)
             if element not in context_dict:
-                context_dict[element] = self._setup_fbo(element, settings, context)
-            else:
-                context_dict[element][5] = True
+                context_dict[element] = self._create_instance(element, settings)
+            context_dict[element].activate()
         elif settings['action'] == "stop":
-            try:
-                context_dict[element][5] = False
-            except IndexError:
-                pass
+            if element in context_dict:
+                context_dict[element].deactivate()
         else:
             raise AssertionError("Unknown action {}".format(settings['action']))
 
-    def _setup_fbo(self, element, settings, context):
-        """Setup FBO for a display."""
+    def _create_instance(self, element, settings) -> DisplayLightInstance:
+        """Create an instance which uses the shared capture of a display."""
         if element not in self.machine.displays:
             raise AssertionError("Display {} not found. Please create it to use display_light_player.".format(element))
         source = self.machine.displays[element]
 
-        # put the widget canvas on a Fbo
-        texture = Texture.create(size=source.size, colorfmt='rgba')
-        fbo = Fbo(size=source.size, texture=texture)
-
-        effect_widget = RelativeLayout()
-
-        effect_widget.size = source.size
-
-        fbo.add(effect_widget.canvas)
-        with source.canvas:
-            callback = Callback(partial(self._trigger_render, context, element))
-
-        return [fbo, effect_widget, source, settings, True, True, True, callback]
+        sampler = LightMapSampler(settings['light_map'], source.native_size[0], source.native_size[1])
+        # average the footprint of every light on the GPU
+        capture = self.machine.get_display_capture(source, settings['sample_radius'])
+        if settings['readback'] == 'light_map':
+            # only read back the pixels around the mapped lights
+            region = sampler.bounding_box
+        else:
+            region = None
 
-    def _trigger_render(self, context, element, *args):
-        del args
-        context_dict = self._get_instance_dict(context)
-        if element not in context_dict:
-            return
-        context_dict[element][6] = True
+        instance = DisplayLightInstance(capture, region, sampler)
+        instance.callback = partial(self._receive_frame, instance)
+        return instance
 
-    def _tick(self, dt) -> None:
-        del dt
-        # run this at the end of the tick to make sure all kivy bind callbacks have executed
-        Clock.schedule_once(self._render_all, -1)
+    def _receive_frame(self, instance, frame):
+        instance.frame = frame
+        instance.dirty = True
+        instance.sampler.set_region(instance.capture.region)
+        if not self._scheduled:
+            self._scheduled = True
+            # captures run at the end of the frame. this still runs before the next frame
+            Clock.schedule_once(self._render_all, -1)
 
     def _render_all(self, dt):
         del dt
+        self._scheduled = False
+        # send one message with all players if MPF supports it
+        batch = 'batch' in self.machine.bcp_processor.light_formats
+        groups = []
         for context, instances in self.instances.items():
             for element, instance in instances.items():
-                if not element[5] or not element[6]:
+                if not instance.active or not instance.dirty:
+                    continue
+                changes = instance.render()
+                if changes is None:
                     continue
-                self._render(instance, element, context)
-
-    # pylint: disable-msg=too-many-locals
-    def _render(self, instance, element, context):
-        fbo, effect_widget, source, settings, first, _, _, _ = instance
-        instance[4] = False
-        instance[6] = False
-
-        # detach the widget from the parent
-        parent = source.parent
-        if parent and hasattr(parent, "remove_display_source"):
-            parent.remove_display_source(source)
-
-        effect_widget.add_widget(source.container)
-
-        fbo.draw()
-
-        fbo.bind()
-        data = glReadPixels(0, 0, source.native_size[0], source.native_size[1],
-                            GL_RGBA, GL_UNSIGNED_BYTE)
-
-        fbo.release()
-
-        effect_widget.remove_widget(source.container)
-
-        # reattach to the parent
-        if parent and hasattr(parent, "add_display_source"):
-            parent.add_display_source(source)
 
-        if not first:
-            # for some reasons we got garbage in the first buffer. we just skip it for now
-            values = {}
-            width = source.native_size[0]
-            height = source.native_size[1]
-            for x, y, name in settings['light_map']:
-                x_pixel = int(x * width)
-                y_pixel = height - int(y * height)
-                if (data[width * y_pixel * 4 + x_pixel * 4 + 3]) == 0:
-                    # pixel is transparent
-                    value = -1
+                if batch:
+                    groups.append((context, element, changes))
                 else:
-                    value = (
-                        data[width * y_pixel * 4 + x_pixel * 4],
-                        data[width * y_pixel * 4 + x_pixel * 4 + 1],
-                        data[width * y_pixel * 4 + x_pixel * 4 + 2])
-
-                if name not in self._last_color or self._last_color[name] != value:
-                    self._last_color[name] = value
-                    values[name] = value
-
-            self.machine.bcp_processor.send("trigger", name="display_light_player_apply", context=context,
-                                            values=values, element=element, _silent=True)
-        # clear the fbo background
-        fbo.bind()
-        fbo.clear_buffer()
-        fbo.release()
+                    names = instance.sampler.names
+                    self.machine.bcp_processor.send(
+                        "trigger", name="display_light_player_apply", context=context,
+                        values={names[index]: value for index, value in changes}, element=element, _silent=True)
+
+        if groups:
+            self.machine.bcp_processor.send("display_light_player_apply", rawbytes=encode_light_batch(groups))
 
     def clear_context(self, context):
         context_dict = self._get_instance_dict(context)
-        for _, instance in context_dict.items():
-            instance[2].canvas.remove(instance[7])
+        for instance in context_dict.values():
+            instance.deactivate()
         self._reset_instance_dict(context)
 
 
@@ -1,5 +1,8 @@
 from mpf.config_players.bcp_plugin_player import BcpPluginPlayer
 
+from mpfmc.core.config_spec import add_mc_config_spec
+from mpfmc.core.display_light_encoding import decode_light_batch
+
 
 class DisplayLightPlayer(BcpPluginPlayer):
 
@@ -7,9 +10,25 @@ class DisplayLightPlayer(BcpPluginPlayer):
     show_section = 'display_lights'
 
     def __init__(self, machine):
+        # settings which are only known to MPF-MC have to pass validation in MPF
+        add_mc_config_spec(machine.config_validator.get_config_spec())
         super().__init__(machine)
 
         self.machine.events.add_handler("display_light_player_apply", self._apply_lights)
+        # MC sends all players in one binary message if we asked for the batch format in hello
+        self.machine.bcp.interface.register_command_callback("display_light_player_apply", self._apply_batch)
+
+    async def _apply_batch(self, client, rawbytes, **kwargs):
+        """Apply a batch of display light changes received via BCP."""
+        del client
+        del kwargs
+        for context, element, changes in decode_light_batch(rawbytes):
+            context_dict = self._get_instance_dict(context)
+            if element not in context_dict:
+                continue
+
+            names = context_dict[element][2]
+            self._apply_lights(context, element, {names[index]: value for index, value in changes})
 
     def _apply_lights(self, context, element, values, **kwargs):
         del kwargs
@@ -46,7 +65,9 @@ class DisplayLightPlayer(BcpPluginPlayer):
 
         for element, s in settings.items():
             if s['action'] == "play":
-                context_dict[element] = [self.machine.clock.get_time(), priority]
+                # the names are needed to resolve light indexes in batches
+                context_dict[element] = [self.machine.clock.get_time(), priority,
+                                         [name for _, _, name in s['light_map']]]
             elif s['action'] == "stop":
                 try:
                     del context_dict[element]
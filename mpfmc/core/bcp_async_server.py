@@ -0,0 +1,278 @@
+"""Asyncio based BCP Server interface for the MPF Media Controller"""
+
+import asyncio
+import queue
+import sys
+import threading
+import time
+import traceback
+
+from mpfmc.core.bcp_server import BcpServerBase, create_server_socket, encode_message, get_socket_stats, \
+    get_host_and_port, parse_payload_length
+
+
+class AsyncBCPServer(BcpServerBase):
+    """BCP Server which runs all socket IO in an asyncio event loop.
+
+    This is an alternative to :class:`BCPServer` which is selected with
+    bcp_transport: asyncio in the mpf-mc section of the config. It runs the
+    event loop on its own thread and puts received commands into the receive
+    queue the same way. Inbound messages with a ``&bytes=`` trailer are read
+    completely and their payload is passed in the rawbytes kwarg.
+
+    Outgoing commands are moved from the sending queue to a bounded queue in
+    the event loop. Reading stops while the receive queue is full so TCP flow
+    control slows down MPF instead of growing the queue without limit.
+
+    Args:
+        mc: A reference to the main MediaController instance.
+        receiving_queue: A shared Queue() object which holds incoming BCP
+            commands.
+        sending_queue: A shared Queue() object which holds outgoing BCP
+            commands.
+
+    """
+
+    def __init__(self, mc, receiving_queue, sending_queue):
+
+        super().__init__(mc, receiving_queue, sending_queue)
+        self.loop = None
+        self._outgoing = None
+        self._connection_closed = None
+        # set when the connection closes to stop taking commands from the sending queue
+        self._stop_moving = threading.Event()
+
+        config = mc.machine_config['mpf-mc']
+        self.queue_size = config['bcp_queue_size']
+        self.max_message_size = config['bcp_max_message_size']
+        if config['bcp_max_clients'] > 1:
+            self.log.warning("bcp_max_clients is not supported by the asyncio transport. Only one client "
+                             "(MPF) can connect. Use bcp_transport: thread for read-only clients.")
+        self.stats = {'messages_received': 0,
+                      'bytes_received': 0,
+                      'messages_sent': 0,
+                      'bytes_sent': 0,
+                      'receive_queue_full': 0}
+
+        # bind in the constructor so errors are raised on startup
+        self.socket = create_server_socket(config['bcp_interface'], config['bcp_port'], self.log)
+
+    def run(self):
+        """Run the event loop until MPF-MC stops."""
+        try:
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            self._outgoing = asyncio.Queue(maxsize=self.queue_size)
+            self._connection_closed = asyncio.Event()
+            self.loop.run_until_complete(self._serve())
+
+        except Exception:   # noqa
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            lines = traceback.format_exception(exc_type, exc_value,
+                                               exc_traceback)
+            msg = ''.join(line for line in lines)
+            self.mc.crash_queue.put(msg)
+
+    async def _serve(self):
+        self.log.info("Waiting for a connection...")
+        # see BCPServer.run for the documentation of this event
+        host, port = get_host_and_port(self.socket.getsockname())
+        self.receive_queue.put(('trigger',
+                                {'name': 'client_disconnected',
+                                 'host': host,
+                                 'port': port}))
+        self.mc.bcp_client_connected = False
+
+        server = await asyncio.start_server(self._handle_connection, sock=self.socket,
+                                            limit=self.max_message_size)
+
+        start_time = time.time()
+        while not self.done and not self.mc.thread_stopper.is_set():
+            if (not self.mc.bcp_client_connected and self.mc.options['production'] and
+                    start_time + 30 < time.time()):
+                self.log.warning("Timeout while waiting for connection. Stopping!")
+                self.mc.stop()
+                break
+
+            await asyncio.sleep(.1)
+
+        self.log.info("Stopping BCP event loop")
+        server.close()
+        if self.connection:
+            # the connection handler stops reading and cleans up its tasks
+            self.connection.close()
+            try:
+                await asyncio.wait_for(self._connection_closed.wait(), 1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _handle_connection(self, reader, writer):
+        if self.connection:
+            self.log.warning("Rejecting BCP connection because a client is already connected.")
+            writer.close()
+            return
+
+        try:
+            self.connection = writer
+            host, port = get_host_and_port(writer.get_extra_info('peername'))
+            self.log.info("Received connection from: %s:%s", host, port)
+
+            # see BCPServer.run for the documentation of this event
+            self.receive_queue.put(('trigger',
+                                    {'name': 'client_connected',
+                                     'host': host,
+                                     'port': port}))
+            self.mc.bcp_client_connected = True
+
+            self._stop_moving.clear()
+            move_task = self.loop.create_task(self._move_sending_queue())
+            sending_task = self.loop.create_task(self._sending_loop(writer))
+            try:
+                await self._receiving_loop(reader)
+            finally:
+                # do not cancel the move task while it waits for the sending queue. the command it
+                # takes would be lost. it stops on its own once _stop_moving is set
+                self._stop_moving.set()
+                await asyncio.wait([move_task], timeout=1)
+                move_task.cancel()
+                sending_task.cancel()
+                await asyncio.wait([move_task, sending_task])
+
+            # close connection
+            writer.close()
+            self.connection = None
+            self._connection_closed.set()
+
+            # always exit
+            self.mc.stop()
+
+        except Exception:   # noqa
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            lines = traceback.format_exception(exc_type, exc_value,
+                                               exc_traceback)
+            msg = ''.join(line for line in lines)
+            self.mc.crash_queue.put(msg)
+
+    async def _receiving_loop(self, reader):
+        """Read messages until the connection is closed.
+
+        Messages and payloads larger than bcp_max_message_size and messages
+        with an invalid payload length are logged and skipped like
+        :class:`BcpStreamParser` does.
+        """
+        discard_line = False
+        while not self.mc.thread_stopper.is_set():
+            try:
+                line = await reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError:
+                # socket closed
+                return
+            except asyncio.LimitOverrunError as e:
+                if not discard_line:
+                    self.log.warning("Skipping BCP message larger than bcp_max_message_size (%s bytes).",
+                                     self.max_message_size)
+                # drop what is buffered. the rest of the line is dropped when it arrives
+                await reader.readexactly(e.consumed)
+                discard_line = True
+                continue
+
+            if discard_line:
+                discard_line = False
+                continue
+
+            message = line.strip()
+            if not message:
+                continue
+
+            rawbytes = None
+            if b'&bytes=' in message:
+                message, length = message.rsplit(b'&bytes=', 1)
+                length = parse_payload_length(length)
+                if length < 0:
+                    # the payload cannot be found in the stream. continue with the next line
+                    self.log.warning("Skipping BCP message with invalid payload length: %s", message)
+                    continue
+
+                if length > self.max_message_size:
+                    self.log.warning("Skipping BCP message with a payload of %s bytes which is larger than "
+                                     "bcp_max_message_size (%s bytes): %s", length, self.max_message_size, message)
+                    if not await self._skip_bytes(reader, length):
+                        return
+                    continue
+
+                try:
+                    rawbytes = await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    return
+
+            self.stats['messages_received'] += 1
+            self.stats['bytes_received'] += len(line) + (len(rawbytes) if rawbytes else 0)
+
+            try:
+                decoded_message = message.decode()
+            except UnicodeDecodeError:
+                self.log.warning("Failed to decode BCP message: %s", message)
+                continue
+
+            while self.receive_queue.qsize() >= self.queue_size and not self.mc.thread_stopper.is_set():
+                # the main loop is behind. stop reading until it catches up
+                self.stats['receive_queue_full'] += 1
+                await asyncio.sleep(.001)
+
+            self.process_received_message(decoded_message, rawbytes)
+
+    @staticmethod
+    async def _skip_bytes(reader, length) -> bool:
+        """Discard length bytes without buffering them. Returns false if the connection closed."""
+        while length:
+            data = await reader.read(min(length, 65536))
+            if not data:
+                return False
+            length -= len(data)
+
+        return True
+
+    def _get_from_sending_queue(self):
+        """Wait for the next command or return None when the connection closed.
+
+        This runs in the executor. A command is only taken from the sending
+        queue while the move task is still waiting for it.
+        """
+        while not self._stop_moving.is_set() and not self.mc.thread_stopper.is_set():
+            try:
+                return self.sending_queue.get(block=True, timeout=.1)
+            except queue.Empty:
+                pass
+
+        return None
+
+    async def _move_sending_queue(self):
+        """Move commands from the thread safe sending queue into the event loop."""
+        while True:
+            item = await self.loop.run_in_executor(None, self._get_from_sending_queue)
+            if item is None:
+                return
+            await self._outgoing.put(item)
+
+    async def _sending_loop(self, writer):
+        """Write outgoing commands and wait while the socket buffer is full."""
+        while True:
+            msg, rawbytes = await self._outgoing.get()
+
+            buffers = encode_message(msg, rawbytes)
+            self.stats['bytes_sent'] += sum(len(buffer) for buffer in buffers)
+            self.stats['messages_sent'] += 1
+            writer.writelines(buffers)
+
+            await writer.drain()
+
+    def get_stats(self) -> dict:
+        """Return socket buffer, queue and traffic stats."""
+        writer = self.connection
+        stats = get_socket_stats(writer.get_extra_info('socket') if writer else None)
+        stats.update(self.stats)
+        stats['receive_queue'] = self.receive_queue.qsize()
+        stats['sending_queue'] = self.sending_queue.qsize()
+        stats['outgoing_queue'] = self._outgoing.qsize() if self._outgoing else 0
+        stats['write_buffer'] = writer.transport.get_write_buffer_size() if writer else 0
+        return stats
@@ -0,0 +1,83 @@
+"""Latency statistics for received BCP commands."""
+from bisect import bisect_left
+
+from typing import Optional
+
+
+class LatencyHistogram:
+
+    """Histogram of latencies with fixed buckets in milliseconds."""
+
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    __slots__ = ["counts", "count", "total", "max"]
+
+    def __init__(self):
+        """Initialise histogram."""
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        """Add a latency in seconds."""
+        milliseconds = seconds * 1000
+        self.counts[bisect_left(self.BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    def get_stats(self) -> dict:
+        """Return count, mean, max and all non empty buckets."""
+        buckets = {}
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            if index < len(self.BUCKETS):
+                buckets['<={}ms'.format(self.BUCKETS[index])] = count
+            else:
+                buckets['>{}ms'.format(self.BUCKETS[-1])] = count
+
+        return {'count': self.count,
+                'mean_ms': self.total / self.count if self.count else 0.0,
+                'max_ms': self.max,
+                'buckets': buckets}
+
+
+class BcpLatencyStats:
+
+    """Latency histograms per BCP command.
+
+    Every command is measured in three stages. queue is the time from
+    socket arrival until the main thread took it from the receive queue,
+    handler is the time spent in the BCP handler and total covers both.
+    Commands which did not arrive via the socket (e.g. in tests) only
+    have a handler latency.
+    """
+
+    __slots__ = ["commands"]
+
+    def __init__(self):
+        """Initialise stats."""
+        self.commands = {}
+
+    def record(self, command: str, received_time: Optional[float], dequeue_time: float,
+               completion_time: float) -> None:
+        """Record the timestamps (from time.perf_counter) of one command."""
+        try:
+            histograms = self.commands[command]
+        except KeyError:
+            histograms = self.commands[command] = {'queue': LatencyHistogram(),
+                                                   'handler': LatencyHistogram(),
+                                                   'total': LatencyHistogram()}
+
+        histograms['handler'].add(completion_time - dequeue_time)
+        if received_time is not None:
+            histograms['queue'].add(dequeue_time - received_time)
+            histograms['total'].add(completion_time - received_time)
+
+    def get_stats(self) -> dict:
+        """Return the stats of all histograms per command."""
+        return {command: {stage: histogram.get_stats() for stage, histogram in histograms.items()}
+                for command, histograms in self.commands.items()}
@@ -1,7 +1,9 @@
+from collections import OrderedDict, deque
 from copy import deepcopy
 
 import queue
 import logging
+import time
 from distutils.version import LooseVersion
 
 import psutil
@@ -9,8 +11,16 @@ from kivy.clock import Clock
 
 import mpf.core.bcp.bcp_socket_client as bcp
 from mpfmc._version import __bcp_version__, version as mc_version, extended_version as mc_extended_version
+from mpfmc.core.bcp_async_server import AsyncBCPServer
+from mpfmc.core.bcp_latency import BcpLatencyStats
 from mpfmc.core.bcp_server import BCPServer
 
+# frame formats for dmd_frame/rgb_dmd_frame which a client can request in hello
+SUPPORTED_FRAME_FORMATS = ('delta', 'shared_memory')
+
+# formats for display_light_player updates which a client can request in hello
+SUPPORTED_LIGHT_FORMATS = ('batch', )
+
 
 class BcpProcessor:
     def __init__(self, mc):
@@ -19,11 +29,14 @@ class BcpProcessor:
 
         self.socket_thread = None
         self.connected = False
+        self.frame_formats = set()
+        self.light_formats = set()
         self.receive_queue = queue.Queue()
         self.sending_queue = queue.Queue()
         self.mc_process = psutil.Process()
 
-        if self.mc.options['bcp']:
+        # a replay takes the place of MPF. nothing is sent
+        if self.mc.options['bcp'] and not self.mc.options.get('bcp_replay'):
             self.mc.events.add_handler('init_done', self._start_socket_thread)
             self.enabled = True
         else:
@@ -31,6 +44,24 @@ class BcpProcessor:
 
         self.debug_log = self.mc.machine_config['bcp']['debug']
 
+        # collapse updates of the same variable which arrive in one frame
+        self.coalesce_variables = self.mc.machine_config['mpf-mc']['bcp_coalesce_variables']
+        self.coalesced_variables = {'player_variable': 0, 'machine_variable': 0}
+
+        # budget per frame. leftover commands are processed in the next frame
+        self.max_commands_per_frame = self.mc.machine_config['mpf-mc']['bcp_max_commands_per_frame']
+        self.max_time_per_frame = self.mc.machine_config['mpf-mc']['bcp_max_ms_per_frame'] / 1000.0
+        self._pending = deque()
+        self._backlog_start = None
+        self.latency = BcpLatencyStats()
+        self.frame_stats = {'queue_depth': 0,
+                            'max_queue_depth': 0,
+                            'commands_per_frame': 0,
+                            'max_commands_per_frame': 0,
+                            'deferred_frames': 0,
+                            'lag': 0.0,
+                            'max_lag': 0.0}
+
         self.bcp_commands = {'error': self._bcp_error,
                              'goodbye': self._bcp_goodbye,
                              'hello': self._bcp_hello,
@@ -52,6 +83,7 @@ class BcpProcessor:
 
         self.mc.events.add_handler('client_connected', self._client_connected)
         self.mc.events.add_handler('mc_reset_complete', self._reset_complete)
+        self.mc.events.add_handler('debug_dump_stats', self._debug_dump_latency)
 
         Clock.schedule_interval(self._get_from_queue, 0)
 
@@ -79,8 +111,13 @@ class BcpProcessor:
         if self.socket_thread:
             return
 
-        self.socket_thread = BCPServer(self.mc, self.receive_queue,
-                                       self.sending_queue)
+        if self.mc.machine_config['mpf-mc']['bcp_transport'] == 'asyncio':
+            server_cls = AsyncBCPServer
+        else:
+            server_cls = BCPServer
+
+        self.socket_thread = server_cls(self.mc, self.receive_queue,
+                                        self.sending_queue)
         self.socket_thread.daemon = True
         self.socket_thread.start()
 
@@ -110,29 +147,133 @@ class BcpProcessor:
         if callback:
             callback()
 
-    def receive_bcp_message(self, msg):
+    def receive_bcp_message(self, msg, rawbytes=None, received_time=None):
         """Receives an incoming BCP message to be processed.
 
-        Note this method is intended for testing. Usually BCP messages are
-        handled by the BCP Server thread, but for test purposes it's possible
-        to run mpf-mc without the BCP Server, so in that case you can use this
-        method to send BCP messages into the mpf-mc.
+        Note this method is intended for testing and replay. Usually BCP
+        messages are handled by the BCP Server thread, but for test purposes
+        it's possible to run mpf-mc without the BCP Server, so in that case you
+        can use this method to send BCP messages into the mpf-mc.
 
         Args:
             msg: A string of the BCP message (in the standard BCP format:
                 command?param1=value1&param2=value2...
+            rawbytes: Binary payload of the message (if any)
+            received_time: Arrival time (from time.perf_counter) which is
+                used for the latency stats.
 
         """
         cmd, kwargs = bcp.decode_command_string(msg)
+        if rawbytes is not None:
+            kwargs['rawbytes'] = rawbytes
+        if received_time is not None:
+            kwargs['_received_time'] = received_time
         self.receive_queue.put((cmd, kwargs))
 
     def _get_from_queue(self, dt):
-        """Gets and processes all queued up incoming BCP commands."""
+        """Gets and processes queued up incoming BCP commands.
+
+        When a budget is configured processing stops after
+        bcp_max_commands_per_frame commands or bcp_max_ms_per_frame and
+        continues in the next frame. At least one command is processed per
+        frame.
+        """
         del dt
+        start_time = time.perf_counter()
 
-        while not self.receive_queue.empty():
-            cmd, kwargs = self.receive_queue.get(False)
+        if self.coalesce_variables and not self.receive_queue.empty():
+            commands = list(self._pending)
+            while not self.receive_queue.empty():
+                commands.append(self.receive_queue.get(False))
+
+            self._pending = deque(self._coalesce_variables(commands))
+
+        queue_depth = len(self._pending) + self.receive_queue.qsize()
+        processed = 0
+        while self._pending or not self.receive_queue.empty():
+            if processed and self._budget_exceeded(processed, start_time):
+                break
+
+            if self._pending:
+                cmd, kwargs = self._pending.popleft()
+            else:
+                cmd, kwargs = self.receive_queue.get(False)
+
+            # stamped by the BCP server when the message arrived
+            received_time = kwargs.pop('_received_time', None)
+            dequeue_time = time.perf_counter()
             self._process_command(cmd, **kwargs)
+            self.latency.record(cmd, received_time, dequeue_time, time.perf_counter())
+            processed += 1
+
+        self._update_frame_stats(queue_depth, processed)
+
+    def _budget_exceeded(self, processed, start_time) -> bool:
+        if self.max_commands_per_frame and processed >= self.max_commands_per_frame:
+            return True
+
+        return bool(self.max_time_per_frame and time.perf_counter() - start_time >= self.max_time_per_frame)
+
+    def _update_frame_stats(self, queue_depth, processed):
+        stats = self.frame_stats
+        stats['queue_depth'] = queue_depth
+        stats['commands_per_frame'] = processed
+        stats['max_queue_depth'] = max(stats['max_queue_depth'], queue_depth)
+        stats['max_commands_per_frame'] = max(stats['max_commands_per_frame'], processed)
+
+        if self._pending or not self.receive_queue.empty():
+            # commands are left for the next frame
+            stats['deferred_frames'] += 1
+            if self._backlog_start is None:
+                self._backlog_start = time.perf_counter()
+        elif self._backlog_start is not None:
+            # time it took to catch up
+            stats['lag'] = time.perf_counter() - self._backlog_start
+            stats['max_lag'] = max(stats['max_lag'], stats['lag'])
+            self._backlog_start = None
+
+    def _coalesce_variables(self, commands) -> list:
+        """Collapse consecutive updates of the same variable into the last one.
+
+        Only runs of player_variable and machine_variable commands without any
+        other command in between are collapsed so the order relative to other
+        commands is preserved. The collapsed update keeps the prev_value of the
+        first update in the run and its change is calculated from the final
+        value and that prev_value.
+        """
+        result = []
+        run = OrderedDict()
+        for cmd, kwargs in commands:
+            if cmd == 'player_variable':
+                key = (cmd, kwargs.get('player_num'), kwargs.get('name'))
+            elif cmd == 'machine_variable':
+                key = (cmd, kwargs.get('name'))
+            else:
+                result.extend(run.values())
+                run.clear()
+                result.append((cmd, kwargs))
+                continue
+
+            previous = run.pop(key, None)
+            if previous is not None:
+                self.coalesced_variables[cmd] += 1
+                kwargs = dict(kwargs)
+                kwargs['prev_value'] = previous[1].get('prev_value')
+                kwargs['change'] = self._get_change(kwargs.get('value'), kwargs['prev_value'])
+
+            # the update moves to the position of the last update
+            run[key] = (cmd, kwargs)
+
+        result.extend(run.values())
+        return result
+
+    @staticmethod
+    def _get_change(value, prev_value):
+        """Return change like MPF does: the difference for numbers and whether the value changed otherwise."""
+        if isinstance(value, (int, float)) and isinstance(prev_value, (int, float)):
+            return value - prev_value
+
+        return value != prev_value
 
     def _process_command(self, bcp_command, **kwargs):
         if self.debug_log:
@@ -155,8 +296,14 @@ class BcpProcessor:
             self.log.warning("Received invalid BCP command: %s", bcp_command[:9])
             # self.send('error',message='invalid command', command=bcp_command)
 
-    def _bcp_status_request(self, **kwargs):
-        """Status request."""
+    def _bcp_status_request(self, stats=False, **kwargs):
+        """Status request.
+
+        The status_report only contains cpu, rss and vms because MPF's
+        handler accepts nothing else. Clients which pass stats=true (or
+        bool:True) additionally get a stats_report with the DMD and BCP
+        counters.
+        """
         del kwargs
 
         self.send("status_report",
@@ -164,17 +311,67 @@ class BcpProcessor:
                   rss=self.mc_process.memory_info().rss,
                   vms=self.mc_process.memory_info().vms)
 
+        if stats in (True, 'true'):
+            self.send("stats_report",
+                      dmds={dmd.name: dmd.get_stats() for dmd in self.mc.dmds},
+                      rgb_dmds={dmd.name: dmd.get_stats() for dmd in self.mc.rgb_dmds},
+                      bcp=self.socket_thread.get_stats() if self.socket_thread else {},
+                      bcp_processor=self.get_stats())
+
+    def get_stats(self) -> dict:
+        """Return stats about the processing of received commands."""
+        stats = dict(self.frame_stats)
+        stats['coalesced_player_variables'] = self.coalesced_variables['player_variable']
+        stats['coalesced_machine_variables'] = self.coalesced_variables['machine_variable']
+        stats['latency'] = self.latency.get_stats()
+        return stats
+
+    def _debug_dump_latency(self, **kwargs):
+        del kwargs
+        self.log.info("--- DEBUG DUMP BCP LATENCY ---")
+        for command, stages in sorted(self.latency.get_stats().items()):
+            for stage, stats in sorted(stages.items()):
+                if not stats['count']:
+                    continue
+                self.log.info("%s %s: Count: %s Mean: %.3fms Max: %.3fms Buckets: %s", command, stage,
+                              stats['count'], stats['mean_ms'], stats['max_ms'], stats['buckets'])
+        self.log.info("--- DEBUG DUMP BCP LATENCY END ---")
+
     def _bcp_hello(self, **kwargs):
-        """Processes an incoming BCP 'hello' command."""
+        """Processes an incoming BCP 'hello' command.
+
+        Clients can request additional DMD frame formats by passing a comma
+        separated list as 'dmd_frame_formats' and display light formats as
+        'display_light_formats'. The reply contains the formats which will be
+        used. Clients which do not ask get full frames and one trigger per
+        display light update only.
+        """
         try:
             if LooseVersion(kwargs['version']) == (
                     LooseVersion(__bcp_version__)):
-                self.send('hello', version=__bcp_version__)
+                reply = dict()
+                self.frame_formats = self._negotiate_formats(kwargs, 'dmd_frame_formats',
+                                                             SUPPORTED_FRAME_FORMATS, reply)
+                self.light_formats = self._negotiate_formats(kwargs, 'display_light_formats',
+                                                             SUPPORTED_LIGHT_FORMATS, reply)
+                self.send('hello', version=__bcp_version__, **reply)
             else:
                 self.send('hello', version='unknown protocol version')
         except KeyError:
             self.log.warning("Received invalid 'version' parameter with 'hello'")
 
+    @staticmethod
+    def _negotiate_formats(kwargs, name, supported_formats, reply) -> set:
+        """Return the requested formats which are supported and add them to reply."""
+        requested_formats = kwargs.get(name)
+        if not requested_formats:
+            return set()
+
+        formats = set(requested_format for requested_format in requested_formats.split(',')
+                      if requested_format in supported_formats)
+        reply[name] = ','.join(sorted(formats))
+        return formats
+
     def _bcp_goodbye(self, **kwargs):
         """Processes an incoming BCP 'goodbye' command."""
         # if self.config['mpf-mc']['exit_on_disconnect']:
@@ -0,0 +1,87 @@
+"""Recording of received BCP traffic.
+
+The BCP servers write every received command with its arrival time to a
+compact binary log when MPF-MC is started with --bcp-record. The log can be
+replayed without MPF with --bcp-replay. See :class:`BcpReplay`. This module
+must not import kivy.
+
+The log starts with a header (magic and version). Every record is the
+arrival time in seconds since the recording started, the length of the
+message, the length of the payload (-1 for no payload), the message (UTF-8)
+and the payload.
+"""
+import struct
+import threading
+import time
+
+from typing import Iterator, Optional, Tuple
+
+FILE_MAGIC = b'MPFBCP'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<6sH')
+# arrival time, length of message and length of payload
+RECORD_HEADER = struct.Struct('<dIi')
+
+
+class BcpTrafficRecorder:
+
+    """Write received BCP commands to a binary log.
+
+    Args:
+        path: File which is created (or truncated) for the log.
+    """
+
+    __slots__ = ["path", "_file", "_start_time", "_lock"]
+
+    def __init__(self, path: str) -> None:
+        """Create the log."""
+        self.path = path
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION))
+        self._start_time = time.perf_counter()
+        # the server thread records while the main thread may close the log
+        self._lock = threading.Lock()
+
+    def record(self, message: str, rawbytes=None, received_time: Optional[float] = None) -> None:
+        """Append a message with its arrival time (from time.perf_counter)."""
+        if received_time is None:
+            received_time = time.perf_counter()
+
+        data = message.encode()
+        with self._lock:
+            if not self._file:
+                return
+            self._file.write(RECORD_HEADER.pack(received_time - self._start_time, len(data),
+                                                -1 if rawbytes is None else len(rawbytes)))
+            self._file.write(data)
+            if rawbytes is not None:
+                self._file.write(rawbytes)
+
+    def close(self) -> None:
+        """Flush and close the log. Later messages are not recorded."""
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def read_bcp_log(path: str) -> Iterator[Tuple[float, str, Optional[bytes]]]:
+    """Return (time, message, rawbytes) of all records in a log."""
+    with open(path, "rb") as log:
+        header = log.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size or FILE_HEADER.unpack(header) != (FILE_MAGIC, FILE_VERSION):
+            raise ValueError("{} is not a BCP log (version {}).".format(path, FILE_VERSION))
+
+        while True:
+            header = log.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                # end of log (or a record which was cut off when MPF-MC crashed)
+                return
+
+            received_time, message_length, rawbytes_length = RECORD_HEADER.unpack(header)
+            message = log.read(message_length)
+            rawbytes = log.read(rawbytes_length) if rawbytes_length >= 0 else None
+            if len(message) < message_length or (rawbytes is not None and len(rawbytes) < rawbytes_length):
+                return
+
+            yield received_time, message.decode(), rawbytes
@@ -0,0 +1,89 @@
+"""Replay of recorded BCP traffic."""
+import logging
+import time
+
+from mpfmc.core.bcp_latency import LatencyHistogram
+from mpfmc.core.bcp_recorder import read_bcp_log
+
+MYPY = False
+if MYPY:   # pragma: no cover
+    from mpfmc.core.mc import MpfMc
+
+
+class BcpReplay:
+
+    """Feed a log written by :class:`BcpTrafficRecorder` into MPF-MC.
+
+    Messages are passed to BcpProcessor.receive_bcp_message in the frame in
+    which they are due. With a speed of 2 the log is replayed twice as fast.
+    This reproduces a game session without MPF so slide, widget, audio and
+    DMD changes can be benchmarked against real traffic. The client_connected
+    event is posted when the replay starts because the BCP server does not
+    record it (DMDs are created on client_connected).
+
+    When the log is exhausted and all commands have been processed a report
+    is logged and stored in :attr:`report`. It contains the frame times
+    during the replay, how late messages were fed (lag), the frame stats of
+    the BcpProcessor and its latency stats per command.
+
+    Args:
+        mc: A reference to the main MediaController instance.
+        path: The BCP log.
+        speed: Factor to speed up (or slow down) the replay.
+        stop_when_done: Stop MPF-MC when the replay finished.
+    """
+
+    def __init__(self, mc: "MpfMc", path: str, speed: float = 1.0, stop_when_done: bool = True) -> None:
+        """Load log."""
+        self.mc = mc
+        self.log = logging.getLogger('BCP Replay')
+        self.path = path
+        self.speed = speed
+        self.stop_when_done = stop_when_done
+        self.messages = list(read_bcp_log(path))
+        self.report = None
+        self.frame_time = LatencyHistogram()
+        self.lag = LatencyHistogram()
+        self._position = 0
+        self._start_time = None
+        self._clock_event = None
+
+    def start(self, **kwargs) -> None:
+        """Start the replay (e.g. on init_done)."""
+        del kwargs
+        self.log.info("Replaying %s messages from %s at %sx speed", len(self.messages), self.path, self.speed)
+        # see BCPServer.run for the documentation of this event
+        self.mc.events.post('client_connected', host='replay', port=0)
+        self._start_time = self.mc.clock.get_time()
+        self._clock_event = self.mc.clock.schedule_interval(self._tick, 0)
+
+    def _tick(self, dt) -> None:
+        if self._position:
+            self.frame_time.add(dt)
+
+        elapsed = (self.mc.clock.get_time() - self._start_time) * self.speed
+        messages = self.messages
+        while self._position < len(messages) and messages[self._position][0] <= elapsed:
+            recorded_time, message, rawbytes = messages[self._position]
+            self.lag.add((elapsed - recorded_time) / self.speed)
+            self.mc.bcp_processor.receive_bcp_message(message, rawbytes, time.perf_counter())
+            self._position += 1
+
+        bcp_processor = self.mc.bcp_processor
+        # pylint: disable-msg=protected-access
+        if self._position >= len(messages) and bcp_processor.receive_queue.empty() and not bcp_processor._pending:
+            self._finish()
+
+    def _finish(self) -> None:
+        self._clock_event.cancel()
+        bcp_processor = self.mc.bcp_processor
+        self.report = {'messages': len(self.messages),
+                       'duration': self.mc.clock.get_time() - self._start_time,
+                       'frame_time': self.frame_time.get_stats(),
+                       'lag': self.lag.get_stats(),
+                       'frame_stats': dict(bcp_processor.frame_stats),
+                       'latency': bcp_processor.latency.get_stats()}
+
+        self.log.info("Replay finished: %s", self.report)
+        if self.stop_when_done:
+            self.mc.stop()
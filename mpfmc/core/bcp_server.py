@@ -1,8 +1,10 @@
 """BCP Server interface for the MPF Media Controller"""
 
 import logging
+import os
 import queue
 import socket
+import stat
 import sys
 import threading
 import time
@@ -12,10 +14,414 @@ import select
 
 import mpf.core.bcp.bcp_socket_client as bcp
 from mpf.exceptions.runtime_error import MpfRuntimeError
+from mpfmc.core.bcp_recorder import BcpTrafficRecorder
 
+# max number of buffers in one sendmsg call (IOV_MAX on Linux)
+MAX_BUFFERS_PER_WRITE = 1024
 
-class BCPServer(threading.Thread):
-    """Parent class for the BCP Server thread.
+# prefix of bcp_interface for a unix domain socket
+UNIX_SOCKET_PREFIX = 'unix:'
+
+
+def create_server_socket(interface, port, log):
+    """Create a listening socket for BCP.
+
+    Args:
+        interface: String name of which interface this socket will listen
+            on. Use unix:/path/to/socket to listen on a unix domain socket
+            when MPF and MPF-MC run on the same machine.
+        port: Integer TCP port number the socket will listen on. This is
+            ignored for unix domain sockets.
+        log: Logger of the server.
+
+    """
+    if interface.startswith(UNIX_SOCKET_PREFIX):
+        return _create_unix_server_socket(interface[len(UNIX_SOCKET_PREFIX):], log)
+
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    log.info('Starting up on %s port %s', interface, port)
+
+    try:
+        server_socket.bind((interface, port))
+    except IOError as e:
+        raise MpfRuntimeError("Failed to bind BCP Socket to {} on port {}. "
+                              "Is there another application running on that port?".format(interface, port), 1,
+                              log.name) from e
+
+    server_socket.listen(5)
+    return server_socket
+
+
+def _create_unix_server_socket(path, log):
+    if not hasattr(socket, "AF_UNIX"):
+        raise MpfRuntimeError("Unix domain sockets are not supported on this platform. "
+                              "Use a TCP interface for BCP.", 1, log.name)
+
+    log.info('Starting up on unix domain socket %s', path)
+
+    # remove a stale socket of an earlier run but do not take over the socket of a running instance
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode) and not _is_unix_socket_in_use(path):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server_socket.bind(path)
+    except IOError as e:
+        raise MpfRuntimeError("Failed to bind BCP Socket to {}. "
+                              "Is there another application using that path?".format(path), 1,
+                              log.name) from e
+
+    server_socket.listen(5)
+    return server_socket
+
+
+def _is_unix_socket_in_use(path) -> bool:
+    """Return true if something listens on the unix domain socket at path."""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+    except OSError:
+        # e.g. no permission. let bind fail
+        return True
+    finally:
+        probe.close()
+
+    return True
+
+
+def get_host_and_port(address):
+    """Return host and port of a socket address.
+
+    Unix domain sockets have a path (or an empty string for unnamed client
+    sockets) instead of a tuple. Their port is 0.
+    """
+    if isinstance(address, (tuple, list)):
+        return address[0], address[1]
+
+    return address, 0
+
+
+def is_tcp_socket(connection) -> bool:
+    """Return true if connection is a TCP socket."""
+    return connection.family in (socket.AF_INET, socket.AF_INET6)
+
+
+def get_socket_stats(connection) -> dict:
+    """Return the kernel buffer sizes of a connected socket."""
+    if not connection:
+        return {}
+
+    return {'so_sndbuf': connection.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+            'so_rcvbuf': connection.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)}
+
+
+def parse_payload_length(length: bytes) -> int:
+    """Return the length of a payload from a ``&bytes=`` parameter or -1 if it is invalid."""
+    try:
+        length = int(length)
+    except ValueError:
+        return -1
+
+    return length if length >= 0 else -1
+
+
+class BcpStreamParser:
+
+    """Splits a received BCP byte stream into messages.
+
+    Messages end with a newline. A message with a ``&bytes=N`` parameter is
+    followed by N bytes of binary payload which may contain newlines. The
+    payload is read into a preallocated buffer and returned as a memoryview
+    of it. While a payload is incomplete :attr:`payload_buffer` can be used
+    to receive the rest directly into the buffer.
+
+    Messages and payloads larger than max_message_size are logged and
+    skipped. So are messages with an invalid length.
+
+    Args:
+        max_message_size: Maximum size of a message or a payload in bytes.
+        log: Logger of the server.
+    """
+
+    __slots__ = ["max_message_size", "log", "_line", "_discard_line", "_message", "_payload", "_payload_position",
+                 "_skip_remaining"]
+
+    def __init__(self, max_message_size: int, log: logging.Logger) -> None:
+        """Initialise parser."""
+        self.max_message_size = max_message_size
+        self.log = log
+        self._line = bytearray()
+        self._discard_line = False
+        self._message = None
+        self._payload = None
+        self._payload_position = 0
+        self._skip_remaining = 0
+
+    @property
+    def payload_remaining(self) -> int:
+        """Return the number of payload bytes which are still missing."""
+        if self._payload is None:
+            return 0
+        return len(self._payload) - self._payload_position
+
+    @property
+    def payload_buffer(self) -> memoryview:
+        """Return the part of the payload buffer which is still missing."""
+        return self._payload[self._payload_position:]
+
+    def advance_payload(self, count: int) -> list:
+        """Mark count bytes of the payload buffer as received.
+
+        Returns a list with the message if the payload is complete.
+        """
+        self._payload_position += count
+        if self.payload_remaining:
+            return []
+        return [self._finish_payload()]
+
+    def feed(self, data: bytes) -> list:
+        """Parse received data and return a list of complete messages.
+
+        Every message is a tuple of the message (bytes) and its payload (a
+        memoryview or None if the message has no payload).
+        """
+        messages = []
+        position = 0
+        while position < len(data):
+            if self._skip_remaining:
+                # discard a payload which is too large
+                count = min(self._skip_remaining, len(data) - position)
+                self._skip_remaining -= count
+                position += count
+                continue
+
+            if self._payload is not None:
+                count = min(self.payload_remaining, len(data) - position)
+                self._payload[self._payload_position:self._payload_position + count] = \
+                    data[position:position + count]
+                position += count
+                messages.extend(self.advance_payload(count))
+                continue
+
+            end = data.find(b'\n', position)
+            if end == -1:
+                # keep incomplete message
+                self._append_to_line(data[position:])
+                break
+
+            self._append_to_line(data[position:end])
+            line = bytes(self._line).strip()
+            self._line.clear()
+            position = end + 1
+
+            if self._discard_line:
+                self._discard_line = False
+                continue
+
+            if not line:
+                continue
+
+            if b'&bytes=' in line:
+                message, length = line.rsplit(b'&bytes=', 1)
+                self._start_payload(message, length)
+                if self._payload is not None and not self.payload_remaining:
+                    messages.append(self._finish_payload())
+            else:
+                messages.append((line, None))
+
+        return messages
+
+    def _append_to_line(self, data):
+        if self._discard_line:
+            return
+
+        if len(self._line) + len(data) > self.max_message_size:
+            self.log.warning("Skipping BCP message larger than bcp_max_message_size (%s bytes).",
+                             self.max_message_size)
+            self._line.clear()
+            self._discard_line = True
+            return
+
+        self._line += data
+
+    def _start_payload(self, message, length):
+        length = parse_payload_length(length)
+        if length < 0:
+            # the payload cannot be found in the stream. continue with the next line
+            self.log.warning("Skipping BCP message with invalid payload length: %s", message)
+            return
+
+        if length > self.max_message_size:
+            self.log.warning("Skipping BCP message with a payload of %s bytes which is larger than "
+                             "bcp_max_message_size (%s bytes): %s", length, self.max_message_size, message)
+            self._skip_remaining = length
+            return
+
+        self._message = message
+        self._payload = memoryview(bytearray(length))
+        self._payload_position = 0
+
+    def _finish_payload(self):
+        message = (self._message, self._payload)
+        self._message = None
+        self._payload = None
+        return message
+
+
+def encode_message(msg, rawbytes) -> tuple:
+    """Return the buffers of an outgoing message."""
+    if not rawbytes:
+        return ('{}\n'.format(msg).encode('utf-8'), )
+
+    return '{}&bytes={}\n'.format(msg, len(rawbytes)).encode('utf-8'), rawbytes
+
+
+def send_buffers(connection, buffers, stats) -> None:
+    """Write a list of buffers to connection and update the send stats.
+
+    Uses vectored writes and continues from the first unsent byte after a
+    partial write.
+    """
+    if not hasattr(connection, "sendmsg"):
+        # no vectored writes on this platform
+        data = b''.join(buffers)
+        connection.sendall(data)
+        stats['send_calls'] += 1
+        stats['bytes_sent'] += len(data)
+        return
+
+    buffers = [memoryview(buffer).cast('B') for buffer in buffers]
+    index = 0
+    while index < len(buffers):
+        sent = connection.sendmsg(buffers[index:index + MAX_BUFFERS_PER_WRITE])
+        stats['send_calls'] += 1
+        stats['bytes_sent'] += sent
+
+        # skip everything which has been sent and continue after a partial write
+        while sent:
+            length = len(buffers[index])
+            if sent >= length:
+                sent -= length
+                index += 1
+            else:
+                buffers[index] = buffers[index][sent:]
+                sent = 0
+
+
+class BcpClientSession:
+
+    """A secondary BCP client which receives a copy of all outgoing messages.
+
+    Secondary clients (e.g. a monitoring dashboard or a frame recorder) are
+    read-only. Everything they send is ignored except for the hello of the
+    primary client. See :class:`BCPServer`. They receive the same messages
+    as the primary client. This includes DMD frames in the formats which the
+    primary client negotiated in its hello (e.g. delta or shared memory
+    frames). DMDs send a keyframe when a secondary client connects so a
+    client which understands these formats can decode the stream from
+    there. Every session has its own
+    bounded queue and writer thread. When a client falls behind and its
+    queue is full new messages are dropped for that client so it never
+    slows down MPF or other clients.
+
+    Args:
+        connection: The connected socket.
+        host: Host of the client.
+        port: Port of the client.
+        queue_size: Maximum number of queued messages.
+        thread_stopper: Event which is set when MPF-MC stops.
+    """
+
+    __slots__ = ["connection", "host", "port", "parser", "queue", "send_stats", "dropped_messages", "closed",
+                 "_thread_stopper", "_thread"]
+
+    def __init__(self, connection, host, port, queue_size, thread_stopper, parser=None):
+        """Initialise session."""
+        self.connection = connection
+        self.host = host
+        self.port = port
+        # parses what the client sends until the primary client is known
+        self.parser = parser
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.send_stats = {'messages_sent': 0, 'bytes_sent': 0, 'send_calls': 0}
+        self.dropped_messages = 0
+        self.closed = False
+        self._thread_stopper = thread_stopper
+        self._thread = threading.Thread(target=self._sending_loop, name="MPF-MC BCP Client {}:{}".format(host, port))
+        self._thread.daemon = True
+
+    def start(self):
+        """Start the writer thread."""
+        self._thread.start()
+
+    def put(self, encoded_message):
+        """Queue the buffers of a message or drop it if the queue is full."""
+        try:
+            self.queue.put_nowait(encoded_message)
+        except queue.Full:
+            self.dropped_messages += 1
+
+    def detach(self):
+        """Stop sending and return the connection without closing it."""
+        self.closed = True
+        return self.connection
+
+    def close(self):
+        """Stop sending and close the connection."""
+        self.closed = True
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.connection.close()
+
+    def get_stats(self) -> dict:
+        """Return traffic and queue stats of this client."""
+        stats = dict(self.send_stats)
+        stats['host'] = self.host
+        stats['port'] = self.port
+        stats['queue'] = self.queue.qsize()
+        stats['dropped_messages'] = self.dropped_messages
+        return stats
+
+    def _sending_loop(self):
+        while not self.closed and not self._thread_stopper.is_set():
+            try:
+                encoded_messages = [self.queue.get(block=True, timeout=1)]
+            except queue.Empty:
+                continue
+
+            if self.closed:
+                return
+
+            while len(encoded_messages) < MAX_BUFFERS_PER_WRITE // 2:
+                try:
+                    encoded_messages.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            buffers = [buffer for encoded_message in encoded_messages for buffer in encoded_message]
+            try:
+                send_buffers(self.connection, buffers, self.send_stats)
+            except OSError:
+                # client is gone. the server removes the session when it reads EOF
+                return
+            self.send_stats['messages_sent'] += len(encoded_messages)
+
+
+class BcpServerBase(threading.Thread):
+    """Base class of the BCP Server threads.
+
+    It holds the state which all transports share and implements how
+    received messages are passed to the main thread and how the server
+    stops. Subclasses implement run().
 
     Args:
         mc: A reference to the main MediaController instance.
@@ -34,8 +440,83 @@ class BCPServer(threading.Thread):
         self.receive_queue = receiving_queue
         self.sending_queue = sending_queue
         self.connection = None
-        self.socket = None
         self.done = False
+        # log of all received messages which can be replayed with --bcp-replay
+        self.recorder = BcpTrafficRecorder(mc.options['bcp_record']) if mc.options.get('bcp_record') else None
+
+    def stop(self):
+        """ Stops and shuts down the BCP server."""
+        if not self.done:
+            self.log.info("Socket thread stopping.")
+            self.sending_queue.put(('goodbye', None))
+            time.sleep(1)  # give it a chance to send goodbye before quitting
+            self.done = True
+            self.mc.done = True
+            if self.recorder:
+                self.recorder.close()
+
+    def process_received_message(self, message, rawbytes=None):
+        """Puts a received BCP message into the receiving queue.
+
+        Args:
+            message: The incoming BCP message
+            rawbytes: Binary payload of the message (if any)
+
+        """
+        self.log.debug('Received "%s"', message)
+
+        try:
+            cmd, kwargs = bcp.decode_command_string(message)
+        except ValueError:
+            self.log.error("DECODE BCP ERROR. Message: %s", message)
+            raise
+
+        # BcpProcessor measures the latency from here
+        received_time = time.perf_counter()
+        if self.recorder:
+            self.recorder.record(message, rawbytes, received_time)
+
+        if rawbytes is not None:
+            kwargs['rawbytes'] = rawbytes
+        kwargs['_received_time'] = received_time
+        self.receive_queue.put((cmd, kwargs))
+
+
+class BCPServer(BcpServerBase):
+    """Parent class for the BCP Server thread.
+
+    Commands are only received from the primary client (MPF) and MPF-MC
+    stops when it disconnects. Writes to the primary client block when its
+    socket buffer is full. Up to bcp_max_clients - 1 additional read-only
+    clients may connect. See :class:`BcpClientSession`. Every outgoing
+    message is encoded once and the buffers are shared by all clients.
+
+    With bcp_max_clients: 1 the only client is the primary client. Otherwise
+    every client starts as a read-only client and the one which sends a
+    hello with the controller_name in bcp_primary_controller becomes the
+    primary client. The order in which clients connect does not matter.
+
+    Args:
+        mc: A reference to the main MediaController instance.
+        receiving_queue: A shared Queue() object which holds incoming BCP
+            commands.
+        sending_queue: A shared Queue() object which holds outgoing BCP
+            commands.
+
+    """
+
+    def __init__(self, mc, receiving_queue, sending_queue):
+
+        super().__init__(mc, receiving_queue, sending_queue)
+        self.socket = None
+        self.send_stats = {'messages_sent': 0, 'bytes_sent': 0, 'send_calls': 0}
+        # secondary clients. replaced (not modified) so the sending thread can iterate it
+        self.clients = ()
+        self.max_clients = mc.machine_config['mpf-mc']['bcp_max_clients']
+        self.client_queue_size = mc.machine_config['mpf-mc']['bcp_client_queue_size']
+        self.max_message_size = mc.machine_config['mpf-mc']['bcp_max_message_size']
+        self.primary_controller = mc.machine_config['mpf-mc']['bcp_primary_controller']
+        self._parser = None
 
         self.setup_server_socket(mc.machine_config['mpf-mc']['bcp_interface'],
                                  mc.machine_config['mpf-mc']['bcp_port'])
@@ -52,121 +533,90 @@ class BCPServer(threading.Thread):
             port: Integer TCP port number the socket will listen on.
 
         """
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-
-        self.log.info('Starting up on %s port %s', interface, port)
-
-        try:
-            self.socket.bind((interface, port))
-        except IOError as e:
-            raise MpfRuntimeError("Failed to bind BCP Socket to {} on port {}. "
-                                  "Is there another application running on that port?".format(interface, port), 1,
-                                  self.log.name) from e
-
-        self.socket.listen(5)
+        self.socket = create_server_socket(interface, port, self.log)
         self.socket.settimeout(1)
 
+    def get_stats(self) -> dict:
+        """Return socket buffer and queue stats."""
+        stats = get_socket_stats(self.connection)
+        stats.update(self.send_stats)
+        stats['bytes_per_send_call'] = (self.send_stats['bytes_sent'] / self.send_stats['send_calls']
+                                        if self.send_stats['send_calls'] else 0.0)
+        stats['receive_queue'] = self.receive_queue.qsize()
+        stats['sending_queue'] = self.sending_queue.qsize()
+        stats['clients'] = [client.get_stats() for client in self.clients]
+        return stats
+
     def run(self):
         """The socket thread's run loop."""
         try:
+            self.log.info("Waiting for a connection...")
+            # Since posting an event from a thread is not safe, we just
+            # drop the event we want into the receive queue and let the
+            # main loop pick it up
+            host, port = get_host_and_port(self.socket.getsockname())
+            self.receive_queue.put(('trigger',
+                                    {'name': 'client_disconnected',
+                                     'host': host,
+                                     'port': port}))
+            '''event: client_disconnected
+            desc: Posted on the MPF-MC only (e.g. not in MPF) when the BCP
+            client disconnects. This event is also posted when the MPF-MC
+            starts before a client is connected.
+
+            This is useful for triggering a slide notifying of the
+            disconnect.
+
+            args:
+            host: The hostname or IP address that the socket is listening
+            on.
+            port: The port that the socket is listening on.
+
+            '''
+            self.mc.bcp_client_connected = False
+
+            start_time = time.time()
             while not self.mc.thread_stopper.is_set():
-                self.log.info("Waiting for a connection...")
-                # Since posting an event from a thread is not safe, we just
-                # drop the event we want into the receive queue and let the
-                # main loop pick it up
-                self.receive_queue.put(('trigger',
-                                        {'name': 'client_disconnected',
-                                         'host': self.socket.getsockname()[0],
-                                         'port': self.socket.getsockname()[1]}))
-                '''event: client_disconnected
-                desc: Posted on the MPF-MC only (e.g. not in MPF) when the BCP
-                client disconnects. This event is also posted when the MPF-MC
-                starts before a client is connected.
-
-                This is useful for triggering a slide notifying of the
-                disconnect.
-
-                args:
-                host: The hostname or IP address that the socket is listening
-                on.
-                port: The port that the socket is listening on.
+                server_socket = self.socket
+                if not server_socket:
+                    # the sending thread closed the socket because MPF-MC stops
+                    break
 
-                '''
-                self.mc.bcp_client_connected = False
+                sockets = [server_socket] + [client.connection for client in self.clients]
+                if self.connection:
+                    sockets.append(self.connection)
 
-                start_time = time.time()
-                while (not self.connection and
-                        not self.mc.thread_stopper.is_set()):
-                    try:
-                        self.connection, client_address = self.socket.accept()
-                    except (socket.timeout, OSError):
-                        if self.mc.options['production'] and start_time + 30 < time.time():
-                            self.log.warning("Timeout while waiting for connection. Stopping!")
+                try:
+                    ready = select.select(sockets, [], [], 1)[0]
+                except (OSError, ValueError):
+                    if self.mc.thread_stopper.is_set():
+                        break
+                    raise
+
+                if not self.connection and self.mc.options['production'] and start_time + 30 < time.time():
+                    self.log.warning("Timeout while waiting for connection. Stopping!")
+                    self.mc.stop()
+                    return
+
+                for ready_socket in ready:
+                    if ready_socket is server_socket:
+                        self._accept_connection()
+                    elif ready_socket is self.connection:
+                        if not self._receive_from_primary():
+                            # no bytes -> socket closed
+                            self._close_connections()
+                            # always exit
                             self.mc.stop()
                             return
-                        if self.mc.thread_stopper.is_set():
-                            self.log.info("Stopping BCP listener thread")
-                            return
-
-                self.log.info("Received connection from: %s:%s",
-                              client_address[0], client_address[1])
-
-                # Since posting an event from a thread is not safe, we just
-                # drop the event we want into the receive queue and let the
-                # main loop pick it up
-                self.receive_queue.put(('trigger',
-                                        {'name': 'client_connected',
-                                         'host': client_address[0],
-                                         'port': client_address[1]}))
-
-                '''event: client_connected
-                desc: Posted on the MPF-MC only when a BCP client has
-                connected.
-
-                args:
-                address: The IP address of the client that connected.
-                port: The port the client connected on.
-                '''
-
-                self.mc.bcp_client_connected = True
-                socket_chars = b''
-
-                # Receive the data in small chunks and retransmit it
-                while not self.mc.thread_stopper.is_set():
-                    # todo Better large message handling
-                    # if a json message comes in that's larger than 8192, it
-                    # won't be processed properly. So if we end up sticking
-                    # with BCP, we should probably change this to be smarter
-                    # and to check for complete messages before processing them
-
-                    ready = select.select([self.connection], [], [], 1)
-                    if ready[0]:
-                        try:
-                            data_read = self.connection.recv(8192)
-                        except socket.timeout:
-                            pass
-
-                        if data_read:
-                            socket_chars += data_read
-                            commands = socket_chars.split(b"\n")
-
-                            # keep last incomplete command
-                            socket_chars = commands.pop()
-
-                            # process all complete commands
-                            self._process_receives_messages(commands)
-                        else:
-                            # no bytes -> socket closed
-                            break
-
-                # close connection. while loop will not exit if this is not intended.
-                self.connection.close()
-                self.connection = None
+                    else:
+                        self._receive_from_client(ready_socket)
 
-                # always exit
+            if self.connection:
+                self._close_connections()
                 self.mc.stop()
-                return
+            else:
+                self._close_connections()
+                self.log.info("Stopping BCP listener thread")
 
         except Exception:   # noqa
             exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -175,38 +625,174 @@ class BCPServer(threading.Thread):
             msg = ''.join(line for line in lines)
             self.mc.crash_queue.put(msg)
 
-    def _process_receives_messages(self, commands):
+    def _accept_connection(self):
+        """Accept a connection as primary or secondary client or reject it."""
+        try:
+            connection, client_address = self.socket.accept()
+        except (socket.timeout, OSError):
+            return
+
+        if is_tcp_socket(connection):
+            # do not wait for more data before sending small messages
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        host, port = get_host_and_port(client_address)
+
+        if self.max_clients <= 1 and not self.connection:
+            self.log.info("Received connection from: %s:%s", host, port)
+            self._set_primary(connection, host, port, BcpStreamParser(self.max_message_size, self.log))
+
+        elif len(self.clients) + (1 if self.connection else 0) < self.max_clients:
+            self.log.info("Received connection from secondary client: %s:%s", host, port)
+            client = BcpClientSession(connection, host, port, self.client_queue_size, self.mc.thread_stopper,
+                                      BcpStreamParser(self.max_message_size, self.log))
+            client.start()
+            self.clients += (client, )
+            self.receive_queue.put(('trigger',
+                                    {'name': 'secondary_client_connected',
+                                     'host': host,
+                                     'port': port}))
+
+            '''event: secondary_client_connected
+            desc: Posted on the MPF-MC only when a read-only BCP client
+            has connected. DMDs send a keyframe when this is posted.
+
+            args:
+            host: The IP address of the client that connected.
+            port: The port the client connected on.
+            '''
+
+        else:
+            self.log.warning("Rejecting BCP connection from %s:%s because bcp_max_clients (%s) is reached.",
+                             host, port, self.max_clients)
+            connection.close()
+
+    def _set_primary(self, connection, host, port, parser):
+        """Receive commands from connection."""
+        self._parser = parser
+        self.connection = connection
+
+        # Since posting an event from a thread is not safe, we just
+        # drop the event we want into the receive queue and let the
+        # main loop pick it up
+        self.receive_queue.put(('trigger',
+                                {'name': 'client_connected',
+                                 'host': host,
+                                 'port': port}))
+
+        '''event: client_connected
+        desc: Posted on the MPF-MC only when a BCP client has
+        connected.
+
+        args:
+        address: The IP address of the client that connected.
+        port: The port the client connected on.
+        '''
+
+        self.mc.bcp_client_connected = True
+
+    def _is_primary_hello(self, message) -> bool:
+        """Return true if message is the hello of the primary client."""
+        try:
+            cmd, kwargs = bcp.decode_command_string(message.decode())
+        except (UnicodeDecodeError, ValueError):
+            return False
+
+        return cmd == 'hello' and kwargs.get('controller_name') == self.primary_controller
+
+    def _receive_from_primary(self) -> bool:
+        """Receive data from the primary client. Returns false if it disconnected."""
+        parser = self._parser
+        if parser.payload_remaining:
+            # receive binary payloads directly into their buffer
+            bytes_read = self.connection.recv_into(parser.payload_buffer)
+            if not bytes_read:
+                return False
+
+            self._process_receives_messages(parser.advance_payload(bytes_read))
+            return True
+
+        try:
+            data_read = self.connection.recv(8192)
+        except socket.timeout:
+            return True
+
+        if not data_read:
+            return False
+
         # process all complete commands
-        for cmd in commands:
-            if cmd:
-                try:
-                    decoded_cmd = cmd.strip().decode()
-                except UnicodeDecodeError:
-                    self.log.warning("Failed to decode BCP message: %s", cmd.strip())
-                    continue
+        self._process_receives_messages(parser.feed(data_read))
+        return True
 
-                self.process_received_message(decoded_cmd)
+    def _receive_from_client(self, connection):
+        """Handle data of a secondary client and remove it when it disconnects.
 
-    def stop(self):
-        """ Stops and shuts down the BCP server."""
-        if not self.done:
-            self.log.info("Socket thread stopping.")
-            self.sending_queue.put('goodbye', None)
-            time.sleep(1)  # give it a chance to send goodbye before quitting
-            self.done = True
-            self.mc.done = True
+        Until there is a primary client the data is parsed to find its hello.
+        Everything else is discarded.
+        """
+        for client in self.clients:
+            if client.connection is connection:
+                break
+        else:
+            return
+
+        try:
+            data_read = connection.recv(8192)
+        except OSError:
+            data_read = b''
+
+        if not data_read:
+            self.log.info("Secondary client %s:%s disconnected", client.host, client.port)
+            client.close()
+            self.clients = tuple(other for other in self.clients if other is not client)
+            return
+
+        if self.connection:
+            return
+
+        messages = client.parser.feed(data_read)
+        for index, (message, _) in enumerate(messages):
+            if self._is_primary_hello(message):
+                self.log.info("Client %s:%s is the primary client", client.host, client.port)
+                self.clients = tuple(other for other in self.clients if other is not client)
+                self._set_primary(client.detach(), client.host, client.port, client.parser)
+                self._process_receives_messages(messages[index:])
+                return
+
+    def _close_connections(self):
+        """Close the primary and all secondary connections."""
+        for client in self.clients:
+            client.close()
+        self.clients = ()
+
+        # close connection. while loop will not exit if this is not intended.
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def _process_receives_messages(self, commands):
+        # process all complete commands
+        for cmd, rawbytes in commands:
+            try:
+                decoded_cmd = cmd.decode()
+            except UnicodeDecodeError:
+                self.log.warning("Failed to decode BCP message: %s", cmd)
+                continue
+
+            self.process_received_message(decoded_cmd, rawbytes)
 
     def sending_loop(self):
         """Sending loop which transmits data from the sending queue to the
         remote socket.
 
+        All messages which are queued up when the loop wakes up are sent with
+        one vectored write.
+
         This method is run as a thread.
         """
         try:
             while not self.done and not self.mc.thread_stopper.is_set():
                 try:
-                    msg, rawbytes = self.sending_queue.get(block=True,
-                                                           timeout=1)
+                    messages = [self.sending_queue.get(block=True, timeout=1)]
 
                 except queue.Empty:
                     if self.mc.thread_stopper.is_set():
@@ -219,13 +805,14 @@ class BCPServer(threading.Thread):
                     else:
                         continue
 
-                if not rawbytes:
-                    self.connection.sendall(('{}\n'.format(msg)).encode('utf-8'))
+                # every message with rawbytes needs two buffers
+                while len(messages) < MAX_BUFFERS_PER_WRITE // 2:
+                    try:
+                        messages.append(self.sending_queue.get_nowait())
+                    except queue.Empty:
+                        break
 
-                else:
-                    self.connection.sendall('{}&bytes={}\n'.format(
-                        msg, len(rawbytes)).encode('utf-8'))
-                    self.connection.sendall(rawbytes)
+                self._send_messages(messages)
 
         except Exception:   # noqa
             exc_type, exc_value, exc_traceback = sys.exc_info()
@@ -236,18 +823,18 @@ class BCPServer(threading.Thread):
 
             # todo this does not crash mpf-mc
 
-    def process_received_message(self, message):
-        """Puts a received BCP message into the receiving queue.
+    def _send_messages(self, messages):
+        """Send a list of (msg, rawbytes) tuples to all clients."""
+        encoded_messages = [encode_message(msg, rawbytes) for msg, rawbytes in messages]
 
-        Args:
-            message: The incoming BCP message
+        for client in self.clients:
+            for encoded_message in encoded_messages:
+                client.put(encoded_message)
 
-        """
-        self.log.debug('Received "%s"', message)
+        connection = self.connection
+        if not connection:
+            return
 
-        try:
-            cmd, kwargs = bcp.decode_command_string(message)
-            self.receive_queue.put((cmd, kwargs))
-        except ValueError:
-            self.log.error("DECODE BCP ERROR. Message: %s", message)
-            raise
+        self.send_stats['messages_sent'] += len(messages)
+        send_buffers(connection, [buffer for encoded_message in encoded_messages for buffer in encoded_message],
+                     self.send_stats)
@@ -0,0 +1,40 @@
+"""Config spec of MPF-MC settings which are not in the config_spec.yaml of MPF.
+
+This module is used by MPF-MC and by plugins which run in MPF so it must not
+import kivy.
+"""
+from mpf.core.config_spec_loader import ConfigSpecLoader
+from mpf.file_interfaces.yaml_interface import YamlInterface
+
+MC_CONFIG_SPEC = '''
+dmds:
+    gpu_conversion: single|bool|false
+    async_readback: single|bool|false
+    persistent_render: single|bool|false
+    packed: single|bool|false
+    shared_capture: single|bool|false
+    shared_memory_path: single|str|None
+    shared_memory_slots: single|int|4
+rgb_dmds:
+    async_readback: single|bool|false
+    persistent_render: single|bool|false
+    shared_capture: single|bool|false
+    shared_memory_path: single|str|None
+    shared_memory_slots: single|int|4
+display_light_player:
+    readback: single|enum(full,light_map)|full
+    sample_radius: single|int|0
+'''
+
+
+def add_mc_config_spec(config_spec: dict) -> None:
+    """Add the settings in MC_CONFIG_SPEC to config_spec.
+
+    Settings which are already in config_spec (e.g. because MPF added them)
+    are not replaced.
+    """
+    additions = ConfigSpecLoader.process_config_spec(YamlInterface.process(MC_CONFIG_SPEC), "mpf-mc")
+    for section, settings in additions.items():
+        section_spec = config_spec.setdefault(section, {})
+        for setting, spec in settings.items():
+            section_spec.setdefault(setting, spec)
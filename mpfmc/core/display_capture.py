@@ -0,0 +1,140 @@
+"""Shared capture of a display for DMDs and the display light player."""
+from collections import OrderedDict
+
+from kivy.clock import Clock
+from kivy.graphics.fbo import Fbo
+from kivy.graphics.instructions import Callback
+from kivy.graphics.opengl import glReadPixels, GL_RGBA, GL_UNSIGNED_BYTE
+from kivy.graphics.texture import Texture
+from kivy.uix.effectwidget import EffectWidget
+
+from mpfmc.effects.box_average import BoxAverageEffect
+
+MYPY = False
+if MYPY:   # pragma: no cover
+    from mpfmc.core.mc import MpfMc
+    from mpfmc.uix.display import Display
+
+
+class DisplayCapture:
+
+    """Renders a display into a fbo and reads it back at most once per frame.
+
+    Consumers subscribe with a callback which receives a read-only memoryview
+    of the RGBA pixels (bottom row first, as returned by glReadPixels). The
+    display is only rendered when it changed and someone is subscribed.
+
+    Subscribers may pass a region to only request a part of the display. The
+    capture then reads back the bounding box of all requested regions which
+    is stored in the region attribute as (x, y, width, height) in pixels
+    starting at the bottom left corner.
+
+    With an average radius every pixel is averaged with its neighbours on the
+    GPU before it is read back. Use :meth:`MpfMc.get_display_capture` to get the capture of a display.
+
+    Args:
+        mc: A reference to the main MediaController instance.
+        display: The display to capture.
+        average_radius: Number of pixels on each side which are averaged.
+    """
+
+    def __init__(self, mc: "MpfMc", display: "Display", average_radius: int = 0) -> None:
+        """Initialise display capture."""
+        self.mc = mc
+        self.display = display
+        self.average_radius = average_radius
+        self.readbacks = 0
+        self.region = (0, 0, display.native_size[0], display.native_size[1])
+        self._subscribers = OrderedDict()
+        self._dirty = True
+        self._scheduled = False
+
+        texture = Texture.create(size=display.size, colorfmt='rgba')
+        self.fbo = Fbo(size=display.size, texture=texture)
+        self.effect_widget = None
+
+        if average_radius:
+            # two separable passes instead of one pass over the whole square
+            self.effect_widget = EffectWidget()
+            self.effect_widget.effects = [BoxAverageEffect(radius=average_radius),
+                                          BoxAverageEffect(radius=average_radius, vertical=True)]
+            self.effect_widget.size = display.size
+            self.effect_widget.fbo.add(display.container.canvas)
+            self.fbo.add(self.effect_widget.canvas)
+        else:
+            # draw the display by reference. it stays where it is in the widget tree
+            self.fbo.add(display.container.canvas)
+
+        with display.canvas:
+            self.callback = Callback(self._trigger_capture)
+
+        Clock.schedule_interval(self._tick, 0)
+
+    def subscribe(self, callback, region=None) -> None:
+        """Call callback with every new frame of the display.
+
+        Args:
+            callback: Called with the pixels of the captured region.
+            region: Tuple of (x, y, width, height) which callback needs or
+                None for the whole display.
+        """
+        self._subscribers[callback] = region
+        self._update_region()
+        # make sure the new subscriber gets a frame
+        self._dirty = True
+
+    def unsubscribe(self, callback) -> None:
+        """Stop calling callback."""
+        del self._subscribers[callback]
+        self._update_region()
+
+    def _update_region(self) -> None:
+        width, height = self.display.native_size
+        regions = list(self._subscribers.values())
+        if not regions or None in regions:
+            self.region = (0, 0, width, height)
+            return
+
+        left = max(0, min(region[0] for region in regions))
+        bottom = max(0, min(region[1] for region in regions))
+        right = min(width, max(region[0] + region[2] for region in regions))
+        top = min(height, max(region[1] + region[3] for region in regions))
+        self.region = (left, bottom, right - left, top - bottom)
+
+    def _trigger_capture(self, *args):
+        del args
+        self._dirty = True
+
+    def _tick(self, dt) -> None:
+        del dt
+        # run this at the end of the tick to make sure all kivy bind callbacks have executed
+        if self._dirty and self._subscribers and not self._scheduled:
+            self._scheduled = True
+            Clock.schedule_once(self._capture, -1)
+
+    def _capture(self, dt) -> None:
+        del dt
+        self._scheduled = False
+        fbo = self.fbo
+
+        fbo.bind()
+        fbo.clear_buffer()
+        fbo.release()
+
+        # nothing in the widget tree changed so make sure the fbo redraws
+        if self.effect_widget:
+            self.effect_widget.fbo.ask_update()
+        fbo.ask_update()
+        fbo.draw()
+        # drawing the display runs the callback in its canvas. this is not a change
+        self._dirty = False
+
+        fbo.bind()
+        data = glReadPixels(self.region[0], self.region[1], self.region[2], self.region[3],
+                            GL_RGBA, GL_UNSIGNED_BYTE)
+        fbo.release()
+        self.readbacks += 1
+
+        frame = memoryview(data)
+        for callback in list(self._subscribers):
+            callback(frame)
@@ -0,0 +1,62 @@
+"""Binary encoding of batched display_light_player updates sent via BCP.
+
+This module is used by MPF-MC and by the display_light_player plugin in MPF
+so it must not import kivy.
+"""
+import struct
+
+from typing import List, Tuple
+
+# length of context, length of element and number of lights
+GROUP_HEADER = struct.Struct('>HHH')
+# index of the light in the light_map, red, green, blue and a visible flag
+LIGHT_ENTRY = struct.Struct('>HBBBB')
+
+
+def encode_light_batch(groups: List[Tuple[str, str, list]]) -> bytes:
+    """Encode the changed lights of all players in one payload.
+
+    Args:
+        groups: List of (context, element, changes) tuples. Changes is a list
+            of (index, value) tuples where index is the position of the light
+            in the light_map and value is a RGB tuple or -1 to remove the
+            color.
+    """
+    chunks = []
+    for context, element, changes in groups:
+        context = context.encode()
+        element = element.encode()
+        chunks.append(GROUP_HEADER.pack(len(context), len(element), len(changes)))
+        chunks.append(context)
+        chunks.append(element)
+        for index, value in changes:
+            if value == -1:
+                chunks.append(LIGHT_ENTRY.pack(index, 0, 0, 0, 0))
+            else:
+                chunks.append(LIGHT_ENTRY.pack(index, value[0], value[1], value[2], 1))
+
+    return b''.join(chunks)
+
+
+def decode_light_batch(data: bytes) -> List[Tuple[str, str, list]]:
+    """Decode a payload created by :func:`encode_light_batch`."""
+    data = memoryview(data)
+    groups = []
+    position = 0
+    while position < len(data):
+        context_length, element_length, count = GROUP_HEADER.unpack_from(data, position)
+        position += GROUP_HEADER.size
+        context = bytes(data[position:position + context_length]).decode()
+        position += context_length
+        element = bytes(data[position:position + element_length]).decode()
+        position += element_length
+
+        changes = []
+        for _ in range(count):
+            index, red, green, blue, visible = LIGHT_ENTRY.unpack_from(data, position)
+            position += LIGHT_ENTRY.size
+            changes.append((index, (red, green, blue) if visible else -1))
+
+        groups.append((context, element, changes))
+
+    return groups
@@ -1,5 +1,7 @@
 """DMD (hardware device)."""
+import math
 import struct
+import zlib
 
 from kivy.graphics.instructions import Callback
 from kivy.uix.effectwidget import EffectWidget
@@ -9,15 +11,26 @@ from kivy.graphics.fbo import Fbo
 from kivy.graphics.opengl import glReadPixels, GL_RGB, GL_UNSIGNED_BYTE
 from kivy.graphics.texture import Texture
 
+from mpfmc.core.dmd_encoding import DeltaFrameEncoder, pack_shades, pack_shades_array
+from mpfmc.core.dmd_shared_memory import SharedFrameWriter
 from mpfmc.effects.gain import GainEffect
 from mpfmc.effects.flip_vertical import FlipVerticalEffect
 from mpfmc.effects.gamma import GammaEffect
+from mpfmc.effects.shade_pack import ShadePackEffect
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 MYPY = False
 if MYPY:   # pragma: no cover
     from mpfmc.core.mc import MpfMc
 
 
+# the render modes (async readback, persistent render, shared capture and
+# shared memory) each keep some state of their own
+# pylint: disable-msg=too-many-instance-attributes
 class DmdBase:
     """Base class for DMD devices."""
 
@@ -34,37 +47,91 @@ class DmdBase:
         self.config = self._get_validated_config(config)
 
         self.source = self.mc.displays[self.config['source_display']]
-        self.prev_data = None
+        # only a checksum of the last frame is kept for only_send_changes
+        self._prev_checksum = None
+        self.sent_frames = 0
+        self.skipped_frames = 0
+        self.dropped_frames = 0
+        self._delta_encoder = DeltaFrameEncoder(
+            self.source.native_size[1], self.mc.machine_config['mpf-mc']['dmd_keyframe_interval'])
         self._dirty = True
+        # area (from the bottom left) which is read back from the fbo
+        self.readback_size = tuple(self.source.native_size)
+
+        # with async readback a frame is read in the tick after it has been
+        # rendered. this avoids a pipeline stall but adds one frame of latency
+        self.async_readback = self.config['async_readback']
+        self.readback_latency = 1 if self.async_readback else 0
+        self._readback_pending = False
+        self.persistent_render = self.config['persistent_render']
+
+        if not 0.0 <= self.config['brightness'] <= 1.0:
+            raise ValueError("DMD brightness value should be between 0.0 "
+                             "and 1.0. Yours is {}".format(self.config['brightness']))
+
+        # with shared capture the source display is rendered and read back
+        # once for all consumers and brightness/gamma are applied on the CPU
+        self.shared_capture = self.config['shared_capture']
+        self._captured_frame = None
+        if self.shared_capture:
+            self._dirty = False
+            self._color_table = self._build_color_table(self.config['brightness'], self.config['gamma'])
+            self.mc.get_display_capture(self.source).subscribe(self._receive_capture)
+        else:
+            self._setup_fbo()
+
+        # with shared memory frames are written to a ring buffer and only their
+        # sequence number is sent if the client negotiated it
+        self.shared_memory = None
+        if self.config['shared_memory_path']:
+            width, height = self.source.native_size
+            self.shared_memory = SharedFrameWriter(self.config['shared_memory_path'],
+                                                   self.config['shared_memory_slots'],
+                                                   width * height * 3)
+            self.mc.events.add_handler('shutdown', self._close_shared_memory)
+
+        self._set_dmd_fps()
+
+        # read-only BCP clients which connect later need a full frame to start with
+        self.mc.events.add_handler('secondary_client_connected', self.send_keyframe)
 
+        if self.async_readback:
+            self.mc.log.info("Using async readback for %s %s. Frames will be sent with "
+                             "%s frame(s) latency.", self.dmd_name_string, self.name, self.readback_latency)
+
+    def _setup_fbo(self):
+        """Create the fbo and effect chain which renders the source display."""
         # put the widget canvas on a Fbo
         texture = Texture.create(size=self.source.size, colorfmt='rgb')
         self.fbo = Fbo(size=self.source.size, texture=texture)
 
         self.effect_widget = EffectWidget()
+        self.effect_widget.effects = self._create_effects()
+        self.effect_widget.size = self.source.size
+
+        self.fbo.add(self.effect_widget.canvas)
+
+        # with persistent render the canvas of the source display stays in
+        # the effect widget and is drawn by reference (like DisplayOutput
+        # does it) instead of moving the widget around on every frame
+        if self.persistent_render:
+            self._attach_source()
 
+        with self.source.canvas:
+            self.callback = Callback(self._trigger_rendering)
+
+    def _create_effects(self) -> list:
+        """Return the effect chain which is applied before readback."""
         effect_list = list()
         effect_list.append(FlipVerticalEffect())
 
         if self.config['brightness'] != 1.0:
-            if not 0.0 <= self.config['brightness'] <= 1.0:
-                raise ValueError("DMD brightness value should be between 0.0 "
-                                 "and 1.0. Yours is {}".format(self.config['brightness']))
-
             effect_list.append(GainEffect(gain=self.config['brightness']))
 
         if self.config['gamma'] != 1.0:
             effect_list.append(GammaEffect(gamma=self.config['gamma']))
 
-        self.effect_widget.effects = effect_list
-        self.effect_widget.size = self.source.size
-
-        self.fbo.add(self.effect_widget.canvas)
-
-        with self.source.canvas:
-            self.callback = Callback(self._trigger_rendering)
-
-        self._set_dmd_fps()
+        return effect_list
 
     def _trigger_rendering(self, *args):
         del args
@@ -107,15 +174,86 @@ class DmdBase:
         """Draw image for DMD and send it."""
         del args
         # run this at the end of the tick to make sure all kivy bind callbacks have executed
-        if self._dirty:
+        if self._dirty or self._readback_pending:
             Clock.schedule_once(self._render, -1)
 
+    def _receive_capture(self, frame) -> None:
+        """Receive a new frame from the shared display capture."""
+        self._captured_frame = frame
+        self._dirty = True
+
+    @staticmethod
+    def _build_color_table(brightness: float, gamma: float):
+        """Return a translation table which applies brightness and gamma like the effect chain."""
+        if brightness == 1.0 and gamma == 1.0:
+            return None
+
+        return bytes(min(255, int(round(((value / 255.) * brightness) ** gamma * 255)))
+                     for value in range(256))
+
+    def _convert_capture(self, frame) -> bytes:
+        """Convert a RGBA capture (bottom row first) to RGB (top row first)."""
+        width, height = self.source.native_size
+        if numpy is not None:
+            pixels = numpy.frombuffer(frame, dtype=numpy.uint8).reshape(height, width, 4)
+            data = pixels[::-1, :, :3].tobytes()
+        else:
+            row_length = width * 4
+            rows = b''.join(frame[row * row_length:(row + 1) * row_length] for row in range(height - 1, -1, -1))
+            rgb = bytearray(width * height * 3)
+            rgb[0::3] = rows[0::4]
+            rgb[1::3] = rows[1::4]
+            rgb[2::3] = rows[2::4]
+            data = bytes(rgb)
+
+        if self._color_table:
+            data = data.translate(self._color_table)
+
+        return data
+
     def _render(self, dt):
         del dt
+        if self.shared_capture:
+            self._dirty = False
+            self._handle_frame(self._convert_capture(self._captured_frame))
+            return
+
+        if self._readback_pending:
+            # the frame has been rendered during the last tick so the GPU had
+            # a whole frame to finish it and the read will not stall
+            self._readback_pending = False
+            self._handle_frame(self._read_pixels())
+
+        if not self._dirty:
+            return
+
+        self._draw()
+        # drawing the source display runs the callback in its canvas. this is not a change
         self._dirty = False
+
+        if self.async_readback:
+            self._readback_pending = True
+        else:
+            self._handle_frame(self._read_pixels())
+
+    def _attach_source(self):
+        """Add the canvas of the source display to the effect widget permanently."""
+        self.effect_widget.fbo.add(self.source.container.canvas)
+
+    def _draw(self):
+        """Draw the source display into the fbo."""
         widget = self.source
         fbo = self.fbo
 
+        if self.persistent_render:
+            fbo.bind()
+            fbo.clear_buffer()
+            fbo.release()
+            # nothing in the widget tree changed so make sure the effect widget redraws
+            self.effect_widget.fbo.ask_update()
+            fbo.draw()
+            return
+
         # detach the widget from the parent
         parent = widget.parent
         if parent and hasattr(parent, "remove_display_source"):
@@ -130,38 +268,171 @@ class DmdBase:
 
         fbo.draw()
 
-        fbo.bind()
-        data = glReadPixels(0, 0, widget.native_size[0], widget.native_size[1],
-                            GL_RGB, GL_UNSIGNED_BYTE)
-        fbo.release()
-
         self.effect_widget.remove_widget(widget.container)
 
         # reattach to the parent
         if parent and hasattr(parent, "add_display_source"):
             parent.add_display_source(widget)
 
-        if not self.config['only_send_changes'] or self.prev_data != data:
-            self.prev_data = data
-            self.send(data)
+    def _read_pixels(self) -> bytes:
+        """Read back the content of the fbo."""
+        self.fbo.bind()
+        data = glReadPixels(0, 0, self.readback_size[0], self.readback_size[1],
+                            GL_RGB, GL_UNSIGNED_BYTE)
+        self.fbo.release()
+        return data
+
+    def _close_shared_memory(self, **kwargs) -> None:
+        """Close and delete the ring buffer when MPF-MC stops."""
+        del kwargs
+        self.shared_memory.close(remove=True)
+
+    def send_keyframe(self, **kwargs) -> None:
+        """Send the next frame as full frame even if it did not change."""
+        del kwargs
+        self._prev_checksum = None
+        self._delta_encoder.request_keyframe()
+        if not self.shared_capture or self._captured_frame is not None:
+            self._dirty = True
+
+    def _handle_frame(self, data: bytes) -> None:
+        """Process a frame here or pass it to the encoding worker."""
+        if self.mc.dmd_encoding_worker:
+            self.mc.dmd_encoding_worker.submit(self, data)
+        else:
+            self._process_frame(data)
+
+    def _process_frame(self, data: bytes) -> None:
+        """Send a frame which has been read back (unless it did not change)."""
+        if self.config['only_send_changes']:
+            checksum = zlib.crc32(data)
+            if checksum == self._prev_checksum:
+                self.skipped_frames += 1
+                return
+
+            self._prev_checksum = checksum
+
+        self.sent_frames += 1
+        self.send(data)
+
+    def get_stats(self) -> dict:
+        """Return frame statistics for this DMD."""
+        return {
+            'sent_frames': self.sent_frames,
+            'skipped_frames': self.skipped_frames,
+            'dropped_frames': self.dropped_frames,
+            'readback_latency': self.readback_latency,
+        }
 
     def send(self, data: bytes) -> None:
         """Send data to DMD via BCP."""
         raise NotImplementedError
 
+    def _send_frame(self, bcp_command: str, data: bytes) -> None:
+        """Send a frame via BCP as shared memory or delta frame if the client negotiated it."""
+        frame_formats = self.mc.bcp_processor.frame_formats
+        if (self.shared_memory and 'shared_memory' in frame_formats and
+                len(data) <= self.shared_memory.slot_size):
+            sequence = self.shared_memory.write(data)
+            self.mc.bcp_processor.send(bcp_command + '_shared', name=self.name,
+                                       path=self.shared_memory.path, sequence=sequence)
+            return
+
+        if 'delta' in frame_formats:
+            delta = self._delta_encoder.encode(data)
+            if delta is not None:
+                # an empty delta means nothing changed. no need to send that
+                if delta:
+                    self.mc.bcp_processor.send(bcp_command + '_delta', rawbytes=delta, name=self.name,
+                                               row_length=len(data) // self.source.native_size[1])
+                return
+
+        self.mc.bcp_processor.send(bcp_command, rawbytes=data, name=self.name)
+
 
 class Dmd(DmdBase):
     """Monochrome DMD."""
 
+    def __init__(self, mc: "MpfMc", name: str, config: dict) -> None:
+        """Initialise monochrome DMD."""
+        super().__init__(mc, name, config)
+
+        # the shader runs in the effect chain which is not used with shared capture
+        self.gpu_conversion = self.config['gpu_conversion'] and not self.shared_capture
+        if self.gpu_conversion:
+            # the shader packs three shades into every RGB pixel
+            self.readback_size = (math.ceil(self.source.native_size[0] / 3), self.source.native_size[1])
+
     def _get_validated_config(self, config: dict) -> dict:
         return self.mc.config_validator.validate_config('dmds', config)
 
+    def _create_effects(self) -> list:
+        effect_list = super()._create_effects()
+        if self.config['gpu_conversion']:
+            effect_list.append(ShadePackEffect(luminosity=self.config['luminosity']))
+
+        return effect_list
+
+    @staticmethod
+    def _strip_row_padding(data, width: int, row_length: int) -> bytes:
+        """Remove the padding at the end of each row of a shade packed frame."""
+        if width == row_length:
+            return bytes(data)
+
+        return b''.join(data[start:start + width] for start in range(0, len(data), row_length))
+
     @classmethod
-    def _convert_to_single_bytes(cls, data, config: dict) -> bytes:
-        new_data = bytearray()
-        loops = 0
+    def _convert_to_single_bytes(cls, data, config: dict, width: int = 0) -> bytes:
+        """Convert a RGB frame to shades (0-15).
+
+        If packed is set in config two shades are packed into one byte
+        (see :func:`mpfmc.core.dmd_encoding.pack_shades`) which requires width.
+        """
         config.setdefault('luminosity', (.299, .587, .114))
+        config.setdefault('packed', False)
         luminosity = config['luminosity']
+        packed_width = width if config['packed'] else 0
+
+        if numpy is not None:
+            new_data = cls._convert_to_single_bytes_vectorized(data, luminosity, packed_width)
+            if new_data is not None:
+                return new_data
+
+        new_data = cls._convert_to_single_bytes_loop(data, luminosity)
+        if packed_width:
+            return pack_shades(new_data, packed_width)
+
+        return new_data
+
+    @staticmethod
+    def _convert_to_single_bytes_vectorized(data, luminosity, packed_width: int = 0) -> bytes:
+        """Convert a RGB frame to one shade (0-15) per pixel using numpy.
+
+        The math is done in the same order and with the same rounding as
+        :meth:`_convert_to_single_bytes_loop` so the result is identical.
+        Returns None if any pixel is out of range so the caller can fall back
+        to the loop (which raises a descriptive error). If packed_width is set
+        the result is packed two shades per byte.
+        """
+        pixels = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, 3)
+        pixel_weight = ((pixels[:, 0] * luminosity[0]) + (pixels[:, 1] * luminosity[1]) +
+                        (pixels[:, 2] * luminosity[2])) / 255.
+        # numpy.rint rounds half to even just like round()
+        shades = numpy.rint(pixel_weight * 15)
+
+        if shades.size and (shades.min() < 0 or shades.max() > 255):
+            return None
+
+        if packed_width:
+            return pack_shades_array(shades.astype(numpy.uint8), packed_width)
+
+        return shades.astype(numpy.uint8).tobytes()
+
+    @staticmethod
+    def _convert_to_single_bytes_loop(data, luminosity) -> bytes:
+        """Convert a RGB frame to one shade (0-15) per pixel in pure Python."""
+        new_data = bytearray()
+        loops = 0
 
         for r, g, b in struct.iter_unpack('BBB', data):
             loops += 1
@@ -176,9 +447,15 @@ class Dmd(DmdBase):
 
     def send(self, data: bytes) -> None:
         """Send data to DMD via BCP."""
-        data = self._convert_to_single_bytes(data, self.config)
+        width = self.source.native_size[0]
+        if self.gpu_conversion:
+            data = self._strip_row_padding(data, width, self.readback_size[0] * 3)
+            if self.config['packed']:
+                data = pack_shades(data, width)
+        else:
+            data = self._convert_to_single_bytes(data, self.config, width)
 
-        self.mc.bcp_processor.send('dmd_frame', rawbytes=data, name=self.name)
+        self._send_frame('dmd_frame', data)
 
 
 class RgbDmd(DmdBase):
@@ -189,24 +466,44 @@ class RgbDmd(DmdBase):
     def _get_validated_config(self, config: dict) -> dict:
         return self.mc.config_validator.validate_config('rgb_dmds', config)
 
+    def __init__(self, mc: "MpfMc", name: str, config: dict) -> None:
+        """Initialise RGB DMD."""
+        super().__init__(mc, name, config)
+
+        # precompute the reorder once instead of looking at the order for every pixel
+        if self.config['channel_order'] != 'rgb':
+            self._channel_map = self._build_channel_map(self.config['channel_order'])
+        else:
+            self._channel_map = None
+
     @staticmethod
-    def _reorder_channels(data, order):
-        new_data = bytearray()
-        for r, g, b in struct.iter_unpack('BBB', data):
-            for channel in order:
-                if channel == "r":
-                    new_data.append(r)
-                elif channel == "g":
-                    new_data.append(g)
-                elif channel == "b":
-                    new_data.append(b)
-                else:
-                    raise ValueError("Unknown channel {}".format(channel))
+    def _build_channel_map(order) -> tuple:
+        """Return the source channel index (into RGB) for every output channel."""
+        channel_map = []
+        for channel in order:
+            if channel not in ("r", "g", "b"):
+                raise ValueError("Unknown channel {}".format(channel))
+            channel_map.append("rgb".index(channel))
+
+        return tuple(channel_map)
+
+    @staticmethod
+    def _reorder_channels(data, channel_map) -> bytes:
+        """Reorder channels of a RGB frame using strided slices.
+
+        Every output channel is copied in one slice assignment so the work per
+        frame does not depend on the pixel count in Python.
+        """
+        source = memoryview(data)
+        channels = len(channel_map)
+        new_data = bytearray(len(data) // 3 * channels)
+        for target, channel in enumerate(channel_map):
+            new_data[target::channels] = source[channel::3]
 
         return bytes(new_data)
 
     def send(self, data: bytes) -> None:
         """Send data to RGB DMD via BCP."""
-        if self.config['channel_order'] != 'rgb':
-            data = self._reorder_channels(data, self.config['channel_order'])
-        self.mc.bcp_processor.send('rgb_dmd_frame', rawbytes=data, name=self.name)
+        if self._channel_map:
+            data = self._reorder_channels(data, self._channel_map)
+        self._send_frame('rgb_dmd_frame', data)
@@ -0,0 +1,184 @@
+"""Encoding helpers for DMD frames sent via BCP."""
+import struct
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+
+from typing import Optional
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DELTA_BLOCK_HEADER = struct.Struct('>HH')
+
+# lookup tables to split a packed byte into its two shades
+_HIGH_NIBBLE_TABLE = bytes(value >> 4 for value in range(256))
+_LOW_NIBBLE_TABLE = bytes(value & 0x0F for value in range(256))
+
+
+class DeltaFrameEncoder:
+
+    """Encode DMD frames as changed rows relative to the previous frame.
+
+    A delta payload is a sequence of blocks. Every block starts with the
+    first row and the number of rows (two unsigned 16 bit big endian ints)
+    followed by the content of those rows.
+
+    Args:
+        rows: Number of rows in a frame.
+        keyframe_interval: A full frame is sent at least every this many
+            frames.
+    """
+
+    __slots__ = ["rows", "keyframe_interval", "_prev_frame", "_frames_since_keyframe"]
+
+    def __init__(self, rows: int, keyframe_interval: int) -> None:
+        """Initialise encoder."""
+        self.rows = rows
+        self.keyframe_interval = keyframe_interval
+        self._prev_frame = None
+        self._frames_since_keyframe = 0
+
+    def request_keyframe(self) -> None:
+        """Make the next frame a keyframe."""
+        self._prev_frame = None
+
+    def encode(self, frame: bytes) -> Optional[bytes]:
+        """Return a delta payload for frame or None if a keyframe should be sent."""
+        prev_frame = self._prev_frame
+        self._prev_frame = frame
+
+        if (prev_frame is None or len(prev_frame) != len(frame) or
+                self._frames_since_keyframe >= self.keyframe_interval):
+            self._frames_since_keyframe = 0
+            return None
+
+        row_length = len(frame) // self.rows
+        blocks = []
+        first_row = None
+        for row in range(self.rows + 1):
+            changed = (row < self.rows and
+                       frame[row * row_length:(row + 1) * row_length] !=
+                       prev_frame[row * row_length:(row + 1) * row_length])
+            if changed and first_row is None:
+                first_row = row
+            elif not changed and first_row is not None:
+                blocks.append(DELTA_BLOCK_HEADER.pack(first_row, row - first_row))
+                blocks.append(frame[first_row * row_length:row * row_length])
+                first_row = None
+
+        delta = b''.join(blocks)
+
+        if len(delta) >= len(frame):
+            # most of the frame changed. a keyframe is smaller
+            self._frames_since_keyframe = 0
+            return None
+
+        self._frames_since_keyframe += 1
+        return delta
+
+
+class DmdEncodingWorker(threading.Thread):
+
+    """Thread which converts, compares and sends DMD frames.
+
+    The main thread only reads back the frame and hands it over. There is at
+    most one pending frame per DMD. When a new frame arrives before the
+    worker picked up the previous one the stale frame is dropped and counted
+    in the dropped_frames attribute of the DMD.
+
+    Args:
+        mc: A reference to the main MediaController instance.
+    """
+
+    def __init__(self, mc):
+        """Initialise worker."""
+        super().__init__(name="MPF-MC DMD Encoding Worker")
+        self.daemon = True
+        self.mc = mc
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+
+    def submit(self, dmd, data: bytes) -> None:
+        """Queue a frame which has been read back for dmd."""
+        with self._condition:
+            if dmd in self._pending:
+                dmd.dropped_frames += 1
+                del self._pending[dmd]
+            self._pending[dmd] = data
+            self._condition.notify()
+
+    def run(self):
+        """Process pending frames until MPF-MC stops."""
+        try:
+            while not self.mc.thread_stopper.is_set():
+                with self._condition:
+                    if not self._pending:
+                        self._condition.wait(1)
+                        continue
+                    dmd, data = self._pending.popitem(last=False)
+
+                # pylint: disable-msg=protected-access
+                dmd._process_frame(data)
+
+        except Exception:   # noqa
+            exc_type, exc_value, exc_traceback = sys.exc_info()
+            lines = traceback.format_exception(exc_type, exc_value,
+                                               exc_traceback)
+            msg = ''.join(line for line in lines)
+            self.mc.crash_queue.put(msg)
+
+
+def apply_delta_frame(frame: bytearray, delta: bytes, row_length: int) -> bytearray:
+    """Apply a delta payload created by :class:`DeltaFrameEncoder` to frame in place."""
+    delta = memoryview(delta)
+    position = 0
+    while position < len(delta):
+        first_row, row_count = DELTA_BLOCK_HEADER.unpack_from(delta, position)
+        position += DELTA_BLOCK_HEADER.size
+        length = row_count * row_length
+        frame[first_row * row_length:first_row * row_length + length] = delta[position:position + length]
+        position += length
+
+    return frame
+
+
+def pack_shades(data: bytes, width: int) -> bytes:
+    """Pack a frame with one shade (0-15) per byte into two shades per byte.
+
+    The first pixel is stored in the high nibble. If width is odd every row is
+    padded with one zero shade so rows always start at a byte boundary.
+    """
+    if numpy is not None:
+        return pack_shades_array(numpy.frombuffer(data, dtype=numpy.uint8), width)
+
+    if width % 2:
+        data = b''.join(data[start:start + width] + b'\x00' for start in range(0, len(data), width))
+
+    return bytes((high << 4) | low for high, low in zip(data[0::2], data[1::2]))
+
+
+def pack_shades_array(shades, width: int) -> bytes:
+    """Pack a numpy array of shades like :func:`pack_shades`."""
+    shades = shades.reshape(-1, width)
+    if width % 2:
+        shades = numpy.pad(shades, ((0, 0), (0, 1)), 'constant')
+
+    return ((shades[:, 0::2] << 4) | shades[:, 1::2]).astype(numpy.uint8).tobytes()
+
+
+def unpack_shades(data: bytes, width: int) -> bytes:
+    """Unpack a frame created by :func:`pack_shades` to one shade per byte."""
+    data = bytes(data)
+    unpacked = bytearray(len(data) * 2)
+    unpacked[0::2] = data.translate(_HIGH_NIBBLE_TABLE)
+    unpacked[1::2] = data.translate(_LOW_NIBBLE_TABLE)
+
+    if width % 2:
+        row_length = width + 1
+        return b''.join(unpacked[start:start + width] for start in range(0, len(unpacked), row_length))
+
+    return bytes(unpacked)
@@ -0,0 +1,136 @@
+"""Shared memory ring buffer for DMD frames.
+
+Instead of sending every frame via BCP MPF-MC can write frames into a memory
+mapped file and only send the sequence number of the frame. This module is
+used by MPF-MC and by the consumer in MPF so it must not import kivy.
+
+The file starts with a header (magic, version, number of slots and size of a
+slot) followed by the slots. Every slot starts with the sequence number and
+the length of the frame in it followed by the frame. Frame n is written to
+slot n % slots.
+"""
+import mmap
+import os
+import struct
+
+from typing import Optional
+
+FILE_MAGIC = b'MPFR'
+FILE_VERSION = 1
+# magic, version, number of slots and size of the frame area of a slot
+FILE_HEADER = struct.Struct('<4sHHI')
+# sequence number and length of the frame
+SLOT_HEADER = struct.Struct('<QI')
+
+
+class SharedFrameWriter:
+
+    """Write frames into a ring buffer in a memory mapped file.
+
+    The sequence number of a slot is cleared before the frame is written and
+    set afterwards. A reader which sees the expected sequence number before
+    and after copying the frame got a consistent frame.
+
+    Args:
+        path: File which is created (or truncated) for the ring buffer.
+        slots: Number of frames in the ring buffer. A reader has to pick up
+            a frame before this many newer frames have been written.
+        slot_size: Maximum size of a frame in bytes.
+    """
+
+    __slots__ = ["path", "slots", "slot_size", "sequence", "_file", "_map"]
+
+    def __init__(self, path: str, slots: int, slot_size: int) -> None:
+        """Create the file and map it."""
+        if slots < 1:
+            raise ValueError("A shared memory ring buffer needs at least one slot.")
+
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self.sequence = 0
+
+        size = FILE_HEADER.size + slots * (SLOT_HEADER.size + slot_size)
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        FILE_HEADER.pack_into(self._map, 0, FILE_MAGIC, FILE_VERSION, slots, slot_size)
+
+    def write(self, data: bytes) -> int:
+        """Write a frame to the next slot and return its sequence number."""
+        if len(data) > self.slot_size:
+            raise ValueError("Frame with {} bytes does not fit into a slot of {} bytes.".format(
+                len(data), self.slot_size))
+
+        self.sequence += 1
+        offset = _get_slot_offset(self.sequence % self.slots, self.slot_size)
+        # mark the slot as being written
+        SLOT_HEADER.pack_into(self._map, offset, 0, 0)
+        start = offset + SLOT_HEADER.size
+        self._map[start:start + len(data)] = data
+        SLOT_HEADER.pack_into(self._map, offset, self.sequence, len(data))
+        return self.sequence
+
+    def close(self, remove: bool = False) -> None:
+        """Unmap and close the file.
+
+        Args:
+            remove: Also delete the file so consumers do not find a stale
+                ring buffer.
+        """
+        self._map.close()
+        self._file.close()
+        if remove:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class SharedFrameReader:
+
+    """Read frames from a ring buffer written by :class:`SharedFrameWriter`.
+
+    This is what a consumer (e.g. MPF) does with the sequence numbers it
+    receives via BCP.
+
+    Args:
+        path: File of the ring buffer.
+    """
+
+    __slots__ = ["path", "slots", "slot_size", "_file", "_map"]
+
+    def __init__(self, path: str) -> None:
+        """Map the file and validate its header."""
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, self.slot_size = FILE_HEADER.unpack_from(self._map, 0)
+        if magic != FILE_MAGIC or version != FILE_VERSION:
+            self.close()
+            raise ValueError("{} is not a DMD frame ring buffer (version {}).".format(path, FILE_VERSION))
+
+    def read(self, sequence: int) -> Optional[bytes]:
+        """Return the frame with sequence or None if it has been overwritten."""
+        offset = _get_slot_offset(sequence % self.slots, self.slot_size)
+        slot_sequence, length = SLOT_HEADER.unpack_from(self._map, offset)
+        if slot_sequence != sequence:
+            return None
+
+        start = offset + SLOT_HEADER.size
+        data = self._map[start:start + length]
+
+        # the writer might have lapped us while copying
+        if SLOT_HEADER.unpack_from(self._map, offset)[0] != sequence:
+            return None
+
+        return data
+
+    def close(self) -> None:
+        """Unmap and close the file."""
+        self._map.close()
+        self._file.close()
+
+
+def _get_slot_offset(slot: int, slot_size: int) -> int:
+    return FILE_HEADER.size + slot * (SLOT_HEADER.size + slot_size)
@@ -35,7 +35,9 @@ import mpfmc
 from mpfmc._version import __version__
 from mpfmc.assets.video import VideoAsset
 from mpfmc.core.bcp_processor import BcpProcessor
+from mpfmc.core.bcp_replay import BcpReplay
 from mpfmc.core.config_processor import ConfigProcessor
+from mpfmc.core.config_spec import add_mc_config_spec
 from mpfmc.core.mode_controller import ModeController
 from mpfmc.uix.transitions import TransitionManager
 from mpfmc.uix.effects import EffectsManager
@@ -43,6 +45,8 @@ from mpfmc.core.config_collection import create_config_collections
 from mpfmc.assets.image import ImageAsset
 from mpfmc.assets.bitmap_font import BitmapFontAsset
 from mpfmc.core.dmd import Dmd, RgbDmd
+from mpfmc.core.dmd_encoding import DmdEncodingWorker
+from mpfmc.core.display_capture import DisplayCapture
 from mpfmc.core.assets import ThreadedAssetManager
 from mpfmc.core.mc_placeholder_manager import McPlaceholderManager
 from mpfmc.core.mc_settings_controller import McSettingsController
@@ -96,6 +100,7 @@ class MpfMc(App):
             sys.path.append(self.machine_path)
         self.mc_config = config
         self.config_validator = ConfigValidator(self, config.get_config_spec())
+        add_mc_config_spec(self.config_validator.get_config_spec())
         self.machine_config = self.mc_config.get_machine_config()
         self.config = self.machine_config
 
@@ -131,6 +136,8 @@ class MpfMc(App):
         self.keyboard = None
         self.dmds = []
         self.rgb_dmds = []
+        self.dmd_encoding_worker = None
+        self.display_captures = dict()
         self.crash_queue = queue.Queue()
         self.ticks = 0
         self.start_time = 0
@@ -171,6 +178,12 @@ class MpfMc(App):
         self.asset_manager = ThreadedAssetManager(self)
         self.bcp_processor = BcpProcessor(self)
 
+        # feed recorded BCP traffic instead of connecting to MPF
+        self.bcp_replay = None
+        if self.options.get('bcp_replay'):
+            self.bcp_replay = BcpReplay(self, self.options['bcp_replay'], self.options.get('bcp_replay_speed', 1.0))
+            self.events.add_handler('init_done', self.bcp_replay.start)
+
         # Asset classes
         ImageAsset.initialize(self)
         VideoAsset.initialize(self)
@@ -240,6 +253,9 @@ class MpfMc(App):
 
     def _create_dmds(self, **kwargs):
         del kwargs
+        if self.machine_config['mpf-mc']['dmd_encoding_thread'] and not self.dmd_encoding_worker:
+            self.dmd_encoding_worker = DmdEncodingWorker(self)
+            self.dmd_encoding_worker.start()
         self.create_dmds()
         self.create_rgb_dmds()
         self.events.remove_all_handlers_for_event("client_connected")
@@ -347,6 +363,18 @@ class MpfMc(App):
         self.events.remove_all_handlers_for_event("displays_initialized")
         self._init()
 
+    def get_display_capture(self, display, average_radius=0) -> DisplayCapture:
+        """Return the shared capture for a display (and create it if needed).
+
+        Captures which average pixels are shared by all users of the same
+        radius.
+        """
+        key = (display.name, average_radius)
+        if key not in self.display_captures:
+            self.display_captures[key] = DisplayCapture(self, display, average_radius)
+
+        return self.display_captures[key]
+
     def create_dmds(self):
         """Create DMDs."""
         if 'dmds' in self.machine_config:
@@ -0,0 +1,73 @@
+from kivy.uix.effectwidget import EffectBase
+from kivy.properties import BooleanProperty, NumericProperty
+
+
+class BoxAverageEffect(EffectBase):
+    """GLSL effect to average every pixel with its neighbours in one direction.
+
+    Use a horizontal and a vertical pass together to average a square of
+    (2 * radius + 1) pixels around every pixel. Colors are weighted by their
+    alpha so transparent pixels do not darken the result.
+
+    Args:
+        radius: Number of pixels on each side which are averaged.
+        vertical: Average along the y axis instead of the x axis.
+
+    """
+
+    radius = NumericProperty(1)
+    '''
+    Number of pixels on each side of a pixel which are averaged.
+
+    radius is a :class:`~kivy.properties.NumericProperty` and
+    defaults to 1.
+    '''
+
+    vertical = BooleanProperty(False)
+    '''
+    Average along the y axis instead of the x axis.
+
+    vertical is a :class:`~kivy.properties.BooleanProperty` and
+    defaults to False.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.do_glsl()
+
+    def on_radius(self, *args):
+        self.do_glsl()
+
+    def on_vertical(self, *args):
+        self.do_glsl()
+
+    def do_glsl(self):
+        radius = int(self.radius)
+        self.glsl = box_average_glsl.format(radius=radius,
+                                            count=float(2 * radius + 1),
+                                            x=0.0 if self.vertical else 1.0,
+                                            y=1.0 if self.vertical else 0.0)
+
+
+# the texture contains premultiplied colors. the output is blended again so
+# the average is divided by its alpha to store the premultiplied average
+box_average_glsl = '''
+vec4 effect(vec4 color, sampler2D texture, vec2 tex_coords, vec2 coords)
+{{
+    vec2 pixel_step = vec2({x}, {y}) / resolution;
+    vec4 sum = vec4(0.0);
+    for (int i = -{radius}; i <= {radius}; i++)
+    {{
+        sum += texture2D(texture, tex_coords + float(i) * pixel_step);
+    }}
+    vec4 average = sum / {count};
+    if (average.a <= 0.0)
+    {{
+        return vec4(0.0);
+    }}
+    return vec4(average.rgb / average.a, average.a);
+}}
+'''
+
+effect_cls = BoxAverageEffect
+name = 'box_average'
@@ -0,0 +1,50 @@
+from kivy.uix.effectwidget import EffectBase
+from kivy.properties import ListProperty
+
+
+class ShadePackEffect(EffectBase):
+    """GLSL effect to convert a texture to DMD shades packed three per pixel.
+
+    Every output pixel holds the shades (0-15) of three horizontally adjacent
+    input pixels in its red, green and blue channel. Only the left third of
+    the texture contains useful data afterwards. This is used by monochrome
+    DMDs to read back one byte per DMD pixel instead of three.
+
+    """
+
+    luminosity = ListProperty([.299, .587, .114])
+    '''This defines the luminosity factor for each color channel. The value
+    for each channel must be between 0.0 and 1.0.
+
+    :attr:`luminosity` is a :class:`ListProperty` defaults to
+    (.299, .587, .114)
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.do_glsl()
+
+    def on_luminosity(self, *args):
+        self.do_glsl()
+
+    def do_glsl(self):
+        self.glsl = shade_pack_glsl.format(float(self.luminosity[0]),
+                                           float(self.luminosity[1]),
+                                           float(self.luminosity[2]))
+
+
+shade_pack_glsl = '''
+vec4 effect(vec4 color, sampler2D texture, vec2 tex_coords, vec2 coords)
+{{
+    vec3 luminosity = vec3({}, {}, {});
+    float first_pixel = floor(coords.x) * 3.0;
+    vec3 shades = vec3(
+        dot(texture2D(texture, vec2((first_pixel + 0.5) / resolution.x, tex_coords.y)).rgb, luminosity),
+        dot(texture2D(texture, vec2((first_pixel + 1.5) / resolution.x, tex_coords.y)).rgb, luminosity),
+        dot(texture2D(texture, vec2((first_pixel + 2.5) / resolution.x, tex_coords.y)).rgb, luminosity));
+    return vec4(floor(shades * 15.0 + 0.5) / 255.0, 1.0);
+}}
+'''
+
+effect_cls = ShadePackEffect
+name = 'shade_pack'
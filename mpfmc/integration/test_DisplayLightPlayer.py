@@ -0,0 +1,38 @@
+"""Test display_light_player plugin in MPF."""
+from unittest.mock import patch
+
+from mpfmc.core.display_light_encoding import encode_light_batch
+from mpfmc.tests.MpfIntegrationTestCase import MpfIntegrationTestCase
+
+
+class TestDisplayLightPlayer(MpfIntegrationTestCase):
+
+    def get_config_file(self):
+        return 'config.yaml'
+
+    def get_machine_path(self):
+        return 'integration/machine_files/display_light_player/'
+
+    def _apply_batch(self, groups):
+        client = self.machine.bcp.transport.get_named_client("local_display")
+        self.loop.run_until_complete(self.machine.bcp.interface.process_bcp_message(
+            "display_light_player_apply", {"rawbytes": encode_light_batch(groups)}, client))
+
+    def test_batch(self):
+        player = self.machine.display_light_player
+        self.post_event("play_display_lights")
+        self.advance_time_and_run(.1)
+
+        names = player._get_instance_dict("_global")["dmd"][2]
+        self.assertEqual(["light1", "light2"], sorted(names))
+
+        with patch.object(player, "_apply_lights") as apply_lights:
+            self._apply_batch([("_global", "dmd", [(0, (255, 0, 0)), (1, -1)])])
+        apply_lights.assert_called_once_with("_global", "dmd", {names[0]: (255, 0, 0), names[1]: -1})
+
+        # batches for elements which are not playing are ignored
+        self.post_event("stop_display_lights")
+        self.advance_time_and_run(.1)
+        with patch.object(player, "_apply_lights") as apply_lights:
+            self._apply_batch([("_global", "dmd", [(0, (255, 0, 0))])])
+        apply_lights.assert_not_called()
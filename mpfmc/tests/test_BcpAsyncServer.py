@@ -0,0 +1,135 @@
+import logging
+import queue
+import socket
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from mpfmc.core.bcp_async_server import AsyncBCPServer
+
+
+class TestBcpAsyncServer(unittest.TestCase):
+
+    def setUp(self):
+        self.mc = MagicMock()
+        self.mc.thread_stopper = threading.Event()
+        self.mc.crash_queue = queue.Queue()
+        self.mc.options = {'production': False}
+        self.mc.machine_config = {'mpf-mc': {'bcp_interface': 'localhost',
+                                             'bcp_port': 0,
+                                             'bcp_queue_size': 10,
+                                             'bcp_max_message_size': 8192,
+                                             'bcp_max_clients': 1}}
+        self.receive_queue = queue.Queue()
+        self.sending_queue = queue.Queue()
+        self.server = AsyncBCPServer(self.mc, self.receive_queue, self.sending_queue)
+        self.server.daemon = True
+        self.server.start()
+
+        self.client = socket.create_connection(self.server.socket.getsockname()[:2])
+        self.client.settimeout(5)
+        self.assertEqual('client_disconnected', self._receive()[1]['name'])
+        self.assertEqual('client_connected', self._receive()[1]['name'])
+
+    def tearDown(self):
+        self.mc.thread_stopper.set()
+        self.client.close()
+        self.server.join(5)
+        self.assertTrue(self.mc.crash_queue.empty())
+
+    def _receive(self):
+        cmd, kwargs = self.receive_queue.get(timeout=5)
+        if cmd != 'trigger' or not kwargs['name'].startswith('client_'):
+            self.assertIn('_received_time', kwargs)
+            del kwargs['_received_time']
+        return cmd, kwargs
+
+    def _read_from_client(self, length):
+        data = b''
+        while len(data) < length:
+            data += self.client.recv(length - len(data))
+        return data
+
+    def test_receive(self):
+        payload = bytes(range(256)) * 20
+        # binary payloads contain newlines and may be split anywhere
+        data = b'hello?version=1.1\ndmd_frame?name=dmd&bytes=' + str(len(payload)).encode() + b'\n' + payload + \
+            b'trigger?name=test\n'
+        for position in range(0, len(data), 1000):
+            self.client.sendall(data[position:position + 1000])
+            time.sleep(.01)
+
+        self.assertEqual(('hello', {'version': '1.1'}), self._receive())
+        cmd, kwargs = self._receive()
+        self.assertEqual('dmd_frame', cmd)
+        self.assertEqual('dmd', kwargs['name'])
+        self.assertEqual(payload, kwargs['rawbytes'])
+        self.assertEqual(('trigger', {'name': 'test'}), self._receive())
+        self.assertEqual(3, self.server.get_stats()['messages_received'])
+
+    def test_send(self):
+        self.sending_queue.put(('trigger?name=test', None))
+        self.sending_queue.put(('dmd_frame?name=dmd', b'\x00\n\x01'))
+
+        expected = b'trigger?name=test\ndmd_frame?name=dmd&bytes=3\n\x00\n\x01'
+        self.assertEqual(expected, self._read_from_client(len(expected)))
+
+        stats = self.server.get_stats()
+        self.assertEqual(2, stats['messages_sent'])
+        self.assertEqual(len(expected), stats['bytes_sent'])
+        self.assertIn('so_sndbuf', stats)
+
+    def test_invalid_messages(self):
+        with self.assertLogs('MPF-MC BCP Server', logging.WARNING) as logs:
+            # a message larger than bcp_max_message_size (possibly split across reads) is skipped
+            self.client.sendall(b'x' * 5000)
+            time.sleep(.05)
+            self.client.sendall(b'x' * 5000 + b'\ntrigger?name=first\n')
+            self.assertEqual(('trigger', {'name': 'first'}), self._receive())
+
+            # so are messages with an invalid payload length and payloads which are too large
+            self.client.sendall(b'dmd_frame?name=dmd&bytes=abc\ndmd_frame?name=dmd&bytes=-1\n'
+                                b'dmd_frame?name=dmd&bytes=20000\n' + b'\n' * 20000 + b'trigger?name=second\n')
+            self.assertEqual(('trigger', {'name': 'second'}), self._receive())
+
+        self.assertEqual(4, len(logs.records))
+        self.assertTrue(self.receive_queue.empty())
+
+    def test_bounded_receive_queue(self):
+        self.client.sendall(b''.join('trigger?name=event{}\n'.format(i).encode() for i in range(50)))
+        time.sleep(.2)
+        # reading stops when the queue is full
+        self.assertEqual(10, self.receive_queue.qsize())
+        self.assertGreater(self.server.get_stats()['receive_queue_full'], 0)
+
+        for i in range(50):
+            self.assertEqual(('trigger', {'name': 'event{}'.format(i)}), self._receive())
+
+    def test_disconnect(self):
+        self.client.close()
+        for _ in range(50):
+            if self.mc.stop.called:
+                break
+            time.sleep(.1)
+        self.mc.stop.assert_called_with()
+
+    def test_disconnect_keeps_sending_queue(self):
+        self.client.close()
+        for _ in range(50):
+            if self.server.connection is None and self.mc.stop.called:
+                break
+            time.sleep(.1)
+        self.assertIsNone(self.server.connection)
+
+        # commands queued after the connection closed are not taken from the queue
+        self.sending_queue.put(('trigger?name=test', None))
+        time.sleep(.3)
+        self.assertEqual(1, self.sending_queue.qsize())
+
+    def test_max_clients_not_supported(self):
+        self.mc.machine_config['mpf-mc']['bcp_max_clients'] = 2
+        self.mc.machine_config['mpf-mc']['bcp_port'] = 0
+        with self.assertLogs('MPF-MC BCP Server', logging.WARNING):
+            server = AsyncBCPServer(self.mc, self.receive_queue, self.sending_queue)
+        server.socket.close()
@@ -1,6 +1,12 @@
+import os
+import shutil
+import tempfile
+import time
 from unittest.mock import MagicMock
 
 from mpfmc._version import __version__
+from mpfmc.core.bcp_recorder import BcpTrafficRecorder
+from mpfmc.core.bcp_replay import BcpReplay
 from mpfmc.tests.MpfMcTestCase import MpfMcTestCase
 
 
@@ -93,3 +99,188 @@ class TestBcpProcessor(MpfMcTestCase):
         self.advance_time()
         self.callback.assert_called_with(value='10', prev_value='0',
                                          change='10')
+
+    def test_status_request(self):
+        self.send('status_request')
+        self.advance_time()
+
+        # MPF only accepts cpu, rss and vms in status_report
+        reports = [cmd for cmd in self.sent_bcp_commands if cmd[0] == 'status_report']
+        self.assertEqual(1, len(reports))
+        self.assertEqual({'cpu', 'rss', 'vms'}, set(reports[0][2]))
+        self.assertFalse([cmd for cmd in self.sent_bcp_commands if cmd[0] == 'stats_report'])
+
+        self.send('status_request', stats=True)
+        self.advance_time()
+
+        reports = [cmd for cmd in self.sent_bcp_commands if cmd[0] == 'status_report']
+        self.assertEqual(2, len(reports))
+        self.assertEqual({'cpu', 'rss', 'vms'}, set(reports[1][2]))
+        stats = [cmd for cmd in self.sent_bcp_commands if cmd[0] == 'stats_report']
+        self.assertEqual(1, len(stats))
+        self.assertEqual({}, stats[0][2]['dmds'])
+        self.assertEqual({}, stats[0][2]['rgb_dmds'])
+
+    def test_hello_frame_formats(self):
+        self.send('hello',
+                  version='1.1',
+                  controller_version=__version__,
+                  controller_name='Mission Pinball Framework',
+                  dmd_frame_formats='delta,unknown')
+        self.advance_time()
+
+        response = ('hello', None, {'version': '1.1', 'dmd_frame_formats': 'delta'})
+        self.assertIn(response, self.sent_bcp_commands)
+        self.assertEqual({'delta'}, self.mc.bcp_processor.frame_formats)
+
+    def test_hello_light_formats(self):
+        self.send('hello',
+                  version='1.1',
+                  controller_version=__version__,
+                  controller_name='Mission Pinball Framework',
+                  display_light_formats='batch')
+        self.advance_time()
+
+        response = ('hello', None, {'version': '1.1', 'display_light_formats': 'batch'})
+        self.assertIn(response, self.sent_bcp_commands)
+        self.assertEqual({'batch'}, self.mc.bcp_processor.light_formats)
+        self.assertEqual(set(), self.mc.bcp_processor.frame_formats)
+
+    def test_coalesce_variables(self):
+        self.mc.bcp_processor.coalesce_variables = True
+        self.callback = MagicMock()
+        self.mc.events.add_handler('machine_var_foo', self.callback)
+        self.trigger_callback = MagicMock()
+        self.mc.events.add_handler('test_trigger', self.trigger_callback)
+
+        receive_queue = self.mc.bcp_processor.receive_queue
+        for value in range(1, 4):
+            receive_queue.put(('machine_variable', dict(name='foo', value=value, prev_value=value - 1,
+                                                        change=1)))
+        receive_queue.put(('machine_variable', dict(name='bar', value='x', prev_value=None, change=True)))
+        receive_queue.put(('machine_variable', dict(name='foo', value=3, prev_value=3, change=False)))
+        self.advance_time()
+
+        # one update with the final value and the prev_value of the first update
+        self.assertEqual(3, self.mc.machine_vars['foo'])
+        self.assertEqual('x', self.mc.machine_vars['bar'])
+        self.callback.assert_called_once_with(value=3, prev_value=0, change=3)
+        self.assertEqual(3, self.mc.bcp_processor.get_stats()['coalesced_machine_variables'])
+
+        # updates are not moved across other commands
+        self.callback.reset_mock()
+        receive_queue.put(('machine_variable', dict(name='foo', value=4, prev_value=3, change=1)))
+        receive_queue.put(('trigger', dict(name='test_trigger')))
+        receive_queue.put(('machine_variable', dict(name='foo', value=5, prev_value=4, change=1)))
+        self.advance_time()
+        self.assertEqual(2, self.callback.call_count)
+        self.trigger_callback.assert_called_once_with()
+        self.assertEqual(3, self.mc.bcp_processor.get_stats()['coalesced_machine_variables'])
+
+        # no event when the variable is back at its value from before the run
+        self.callback.reset_mock()
+        receive_queue.put(('machine_variable', dict(name='foo', value='a', prev_value=5, change=True)))
+        receive_queue.put(('machine_variable', dict(name='foo', value=5, prev_value='a', change=True)))
+        self.advance_time()
+        self.assertEqual(5, self.mc.machine_vars['foo'])
+        self.callback.assert_not_called()
+
+        # change is whether the value changed for values which are not numbers
+        receive_queue.put(('machine_variable', dict(name='foo', value='a', prev_value=5, change=True)))
+        receive_queue.put(('machine_variable', dict(name='foo', value='b', prev_value='a', change=True)))
+        self.advance_time()
+        self.callback.assert_called_once_with(value='b', prev_value=5, change=True)
+
+    def test_command_budget(self):
+        processor = self.mc.bcp_processor
+        processor.max_commands_per_frame = 100
+        for i in range(250):
+            processor.receive_queue.put(('machine_variable', dict(name='budget', value=i, change=False)))
+
+        processor._get_from_queue(0)
+        self.assertEqual(99, self.mc.machine_vars['budget'])
+        processor._get_from_queue(0)
+        processor._get_from_queue(0)
+        self.assertEqual(249, self.mc.machine_vars['budget'])
+        stats = processor.get_stats()
+        self.assertEqual(250, stats['max_queue_depth'])
+        self.assertEqual(100, stats['max_commands_per_frame'])
+        self.assertEqual(50, stats['commands_per_frame'])
+        self.assertEqual(2, stats['deferred_frames'])
+
+    def test_burst_time_budget(self):
+        processor = self.mc.bcp_processor
+        processor.max_time_per_frame = .002
+        for i in range(10000):
+            processor.receive_queue.put(('machine_variable', dict(name='var{}'.format(i), value=i, change=False)))
+
+        frames = 0
+        while not processor.receive_queue.empty():
+            start = time.perf_counter()
+            processor._get_from_queue(0)
+            # the budget is only checked between commands
+            self.assertLess(time.perf_counter() - start, .05)
+            frames += 1
+
+        self.assertGreater(frames, 1)
+        self.assertEqual(9999, self.mc.machine_vars['var9999'])
+        stats = processor.get_stats()
+        self.assertEqual(10000, stats['max_queue_depth'])
+        self.assertLess(stats['max_commands_per_frame'], 10000)
+        self.assertGreater(stats['max_lag'], 0)
+
+    def test_latency_stats(self):
+        self.callback = MagicMock()
+        self.mc.events.add_handler('latency_test', self.callback)
+
+        # arrived 20ms ago
+        self.mc.bcp_processor.receive_queue.put(('trigger', dict(name='latency_test',
+                                                                 _received_time=time.perf_counter() - .02)))
+        self.advance_time()
+        # the timestamp is not passed to handlers
+        self.callback.assert_called_once_with()
+
+        self.send('status_request', stats=True)
+        self.advance_time()
+        reports = [cmd for cmd in self.sent_bcp_commands if cmd[0] == 'stats_report']
+        latency = reports[0][2]['bcp_processor']['latency']['trigger']
+        self.assertEqual(1, latency['queue']['count'])
+        self.assertEqual(1, latency['total']['count'])
+        self.assertGreaterEqual(latency['total']['max_ms'], 20)
+        self.assertEqual({'<=25ms': 1}, latency['queue']['buckets'])
+
+        self.mc.events.post('debug_dump_stats')
+        self.advance_time()
+
+    def test_replay(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'bcp.log')
+        recorder = BcpTrafficRecorder(path)
+        for i in range(10):
+            recorder.record('trigger?name=replay_test&number=int:{}'.format(i),
+                            received_time=recorder._start_time + i * .5)
+        recorder.close()
+
+        self.callback = MagicMock()
+        self.mc.events.add_handler('replay_test', self.callback)
+        connected = MagicMock()
+        self.mc.events.add_handler('client_connected', connected)
+
+        # twice as fast. the log spans 4.5s
+        replay = BcpReplay(self.mc, path, speed=2, stop_when_done=False)
+        replay.start()
+        self.advance_time(1)
+        # the replay takes the place of MPF
+        connected.assert_called_once_with(host='replay', port=0)
+        self.assertLess(self.callback.call_count, 10)
+        self.assertIsNone(replay.report)
+
+        self.advance_time(2)
+        self.assertEqual(10, self.callback.call_count)
+        self.callback.assert_called_with(number=9)
+
+        self.assertEqual(10, replay.report['messages'])
+        self.assertGreater(replay.report['frame_time']['count'], 0)
+        self.assertEqual(10, replay.report['lag']['count'])
+        self.assertEqual(10, replay.report['latency']['trigger']['queue']['count'])
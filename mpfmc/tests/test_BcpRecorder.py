@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from mpfmc.core.bcp_recorder import BcpTrafficRecorder, read_bcp_log
+
+
+class TestBcpRecorder(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "bcp.log")
+
+    def test_record_and_read(self):
+        recorder = BcpTrafficRecorder(self.path)
+        recorder.record('hello?version=1.1', received_time=recorder._start_time + .5)
+        recorder.record('dmd_frame?name=dmd', memoryview(bytearray(b'\x00\n\x01')), recorder._start_time + 1.25)
+        recorder.record('trigger?name=empty_payload', b'', recorder._start_time + 2)
+        recorder.close()
+        # messages after close are not recorded
+        recorder.record('trigger?name=late')
+
+        self.assertEqual([(.5, 'hello?version=1.1', None),
+                          (1.25, 'dmd_frame?name=dmd', b'\x00\n\x01'),
+                          (2.0, 'trigger?name=empty_payload', b'')],
+                         list(read_bcp_log(self.path)))
+
+    def test_truncated_log(self):
+        recorder = BcpTrafficRecorder(self.path)
+        recorder.record('trigger?name=a')
+        recorder.record('trigger?name=b', b'\x00' * 10)
+        recorder.close()
+
+        # a crash may cut off the last record
+        with open(self.path, "r+b") as log:
+            log.truncate(os.path.getsize(self.path) - 1)
+
+        self.assertEqual(['trigger?name=a'], [message for _, message, _ in read_bcp_log(self.path)])
+
+    def test_invalid_log(self):
+        with open(self.path, "wb") as log:
+            log.write(b'trigger?name=a\n')
+
+        with self.assertRaises(ValueError):
+            list(read_bcp_log(self.path))
@@ -0,0 +1,255 @@
+import os
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from mpf.exceptions.runtime_error import MpfRuntimeError
+
+from mpfmc.core.bcp_recorder import read_bcp_log
+from mpfmc.core.bcp_server import BCPServer, BcpClientSession
+
+
+class PartialWriteConnection:
+
+    """Connection which accepts at most a few bytes per call."""
+
+    def __init__(self):
+        self.data = b''
+        self.calls = 0
+
+    def sendmsg(self, buffers):
+        self.calls += 1
+        data = b''.join(buffers)[:7]
+        self.data += data
+        return len(data)
+
+
+class TestBcpServer(unittest.TestCase):
+
+    def setUp(self):
+        self.mc = MagicMock()
+        self.mc.thread_stopper = threading.Event()
+        self.mc.crash_queue = queue.Queue()
+        self.mc.options = {'production': False}
+        self.mc.machine_config = {'mpf-mc': {'bcp_interface': 'localhost',
+                                             'bcp_port': 0,
+                                             'bcp_max_clients': 1,
+                                             'bcp_client_queue_size': 1000,
+                                             'bcp_max_message_size': 1048576,
+                                             'bcp_primary_controller': 'Mission Pinball Framework'}}
+        self.receive_queue = queue.Queue()
+        self.sending_queue = queue.Queue()
+        self.server = None
+
+    def _create_server(self):
+        self.server = BCPServer(self.mc, self.receive_queue, self.sending_queue)
+        self.server.daemon = True
+
+    def tearDown(self):
+        self.mc.thread_stopper.set()
+        self.server.sending_thread.join(5)
+        self.assertTrue(self.mc.crash_queue.empty())
+
+    def test_batched_send(self):
+        self._create_server()
+        self.server.start()
+        client = socket.create_connection(self.server.socket.getsockname()[:2])
+        client.settimeout(5)
+        # wait for the connection
+        while self.receive_queue.get(timeout=5)[1]['name'] != 'client_connected':
+            pass
+        self.assertEqual(1, self.server.connection.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+        with self.sending_queue.mutex:
+            # queue all messages at once
+            for i in range(100):
+                self.sending_queue.queue.append(('trigger?name=event{}'.format(i), None))
+                self.sending_queue.queue.append(('dmd_frame?name=dmd', bytes([i]) * 10))
+            self.sending_queue.not_empty.notify()
+
+        expected = b''.join(b'trigger?name=event%d\ndmd_frame?name=dmd&bytes=10\n' % i + bytes([i]) * 10
+                            for i in range(100))
+        data = b''
+        while len(data) < len(expected):
+            data += client.recv(len(expected) - len(data))
+        self.assertEqual(expected, data)
+
+        # stats are updated after the write returned
+        for _ in range(50):
+            if self.server.send_stats['bytes_sent'] == len(expected):
+                break
+            time.sleep(.01)
+        stats = self.server.get_stats()
+        self.assertEqual(200, stats['messages_sent'])
+        self.assertEqual(len(expected), stats['bytes_sent'])
+        self.assertLess(stats['send_calls'], 10)
+        self.assertGreater(stats['bytes_per_send_call'], 1000)
+        client.close()
+
+    def test_partial_writes(self):
+        self._create_server()
+        self.server.connection = PartialWriteConnection()
+        self.server._send_messages([('trigger?name=a', None), ('dmd_frame', b'\x00' * 20), ('trigger?name=b', None)])
+        expected = b'trigger?name=a\ndmd_frame&bytes=20\n' + b'\x00' * 20 + b'trigger?name=b\n'
+        self.assertEqual(expected, self.server.connection.data)
+        self.assertEqual(self.server.connection.calls, self.server.send_stats['send_calls'])
+        self.assertEqual(len(expected), self.server.send_stats['bytes_sent'])
+
+    def _connect(self):
+        client = socket.create_connection(self.server.socket.getsockname()[:2])
+        client.settimeout(5)
+        self.addCleanup(client.close)
+        return client
+
+    @staticmethod
+    def _read(client, length):
+        data = b''
+        while len(data) < length:
+            data += client.recv(length - len(data))
+        return data
+
+    def test_secondary_clients(self):
+        self.mc.machine_config['mpf-mc']['bcp_max_clients'] = 3
+        self._create_server()
+        self.server.start()
+        self.assertEqual('client_disconnected', self.receive_queue.get(timeout=5)[1]['name'])
+
+        # the client which connects first is not the primary client
+        secondaries = [self._connect()]
+        secondaries[0].sendall(b'hello?version=1.1&controller_name=Dashboard\n')
+        primary = self._connect()
+        secondaries.append(self._connect())
+        for _ in range(50):
+            if len(self.server.clients) == 3:
+                break
+            time.sleep(.01)
+        self.assertEqual(3, len(self.server.clients))
+
+        # more clients are rejected
+        rejected = self._connect()
+        self.assertEqual(b'', rejected.recv(100))
+
+        # dmds send keyframes for every read-only client
+        for _ in range(3):
+            self.assertEqual('secondary_client_connected', self.receive_queue.get(timeout=5)[1]['name'])
+
+        # the client which sends the hello of MPF becomes the primary client
+        primary.sendall(b'hello?version=1.1&controller_name=Mission%20Pinball%20Framework\ntrigger?name=first\n')
+        self.assertEqual('client_connected', self.receive_queue.get(timeout=5)[1]['name'])
+        self.assertEqual('hello', self.receive_queue.get(timeout=5)[0])
+        self.assertEqual('first', self.receive_queue.get(timeout=5)[1]['name'])
+        self.assertEqual(2, len(self.server.clients))
+        self.assertNotIn(self.server.connection, [client.connection for client in self.server.clients])
+
+        # every client gets all messages
+        self.sending_queue.put(('trigger?name=test', None))
+        self.sending_queue.put(('dmd_frame?name=dmd', b'\x00\n\x01'))
+        expected = b'trigger?name=test\ndmd_frame?name=dmd&bytes=3\n\x00\n\x01'
+        for client in [primary] + secondaries:
+            self.assertEqual(expected, self._read(client, len(expected)))
+
+        # commands of secondary clients are ignored
+        secondaries[0].sendall(b'trigger?name=ignored\n')
+        primary.sendall(b'trigger?name=test\n')
+        self.assertEqual('test', self.receive_queue.get(timeout=5)[1]['name'])
+
+        # a secondary client may disconnect without stopping MPF-MC
+        secondaries[0].close()
+        for _ in range(50):
+            if len(self.server.clients) == 1:
+                break
+            time.sleep(.01)
+        self.assertEqual(1, len(self.server.clients))
+        self.assertFalse(self.mc.stop.called)
+        self.assertTrue(self.receive_queue.empty())
+
+        primary.close()
+        self.server.join(5)
+        self.mc.stop.assert_called_with()
+        self.assertEqual((), self.server.clients)
+
+    def test_secondary_client_drops_messages(self):
+        self._create_server()
+        self.server.connection = PartialWriteConnection()
+        client = BcpClientSession(None, "localhost", 1234, 2, self.mc.thread_stopper)
+        self.server.clients = (client, )
+
+        messages = [('trigger?name=event{}'.format(i), None) for i in range(4)]
+        self.server._send_messages(messages)
+
+        # the primary client gets everything. the secondary client drops what does not fit in its queue
+        self.assertEqual(b''.join('{}\n'.format(msg).encode() for msg, _ in messages), self.server.connection.data)
+        self.assertEqual(2, client.queue.qsize())
+        self.assertEqual(2, client.dropped_messages)
+        self.assertEqual((b'trigger?name=event0\n', ), client.queue.get_nowait())
+
+    def test_record(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'bcp.log')
+        self.mc.options['bcp_record'] = path
+        self._create_server()
+        self.server.start()
+        client = self._connect()
+        while self.receive_queue.get(timeout=5)[1]['name'] != 'client_connected':
+            pass
+
+        client.sendall(b'trigger?name=test\ndmd_frame?name=dmd&bytes=3\n\x00\n\x01')
+        self.assertEqual('test', self.receive_queue.get(timeout=5)[1]['name'])
+        received_time = self.receive_queue.get(timeout=5)[1]['_received_time']
+        with patch("time.sleep"):
+            self.server.stop()
+
+        records = list(read_bcp_log(path))
+        self.assertEqual([('trigger?name=test', None), ('dmd_frame?name=dmd', b'\x00\n\x01')],
+                         [(message, rawbytes) for _, message, rawbytes in records])
+        self.assertLessEqual(records[0][0], records[1][0])
+        self.assertAlmostEqual(received_time - self.server.recorder._start_time, records[1][0])
+
+    @unittest.skipUnless(hasattr(socket, "AF_UNIX"), "No unix domain sockets on this platform")
+    def test_unix_socket(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'bcp.sock')
+        self.mc.machine_config['mpf-mc']['bcp_interface'] = 'unix:' + path
+        self._create_server()
+        self.server.start()
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.settimeout(5)
+        client.connect(path)
+        while True:
+            cmd, kwargs = self.receive_queue.get(timeout=5)
+            if kwargs['name'] == 'client_connected':
+                break
+        self.assertEqual(0, kwargs['port'])
+
+        client.sendall(b'trigger?name=test\n')
+        cmd, kwargs = self.receive_queue.get(timeout=5)
+        self.assertEqual(('trigger', 'test'), (cmd, kwargs['name']))
+
+        self.sending_queue.put(('dmd_frame?name=dmd', b'\x01\n\x02'))
+        expected = b'dmd_frame?name=dmd&bytes=3\n\x01\n\x02'
+        data = b''
+        while len(data) < len(expected):
+            data += client.recv(len(expected) - len(data))
+        self.assertEqual(expected, data)
+        client.close()
+
+        # a stale socket file from an earlier run is replaced
+        self.mc.thread_stopper.set()
+        self.server.sending_thread.join(5)
+        self.server.join(5)
+        self.mc.thread_stopper.clear()
+        self._create_server()
+        self.assertEqual(path, self.server.socket.getsockname())
+
+        # the socket of a running instance is not taken over
+        with self.assertRaises(MpfRuntimeError):
+            BCPServer(self.mc, self.receive_queue, self.sending_queue)
+        self.assertEqual(path, self.server.socket.getsockname())
@@ -0,0 +1,93 @@
+import logging
+import os
+import random
+import unittest
+
+from mpfmc.core.bcp_server import BcpStreamParser
+
+
+class TestBcpStreamParser(unittest.TestCase):
+
+    @staticmethod
+    def _create_parser(max_message_size=1048576):
+        return BcpStreamParser(max_message_size, logging.getLogger('test'))
+
+    def _random_messages(self, rng, count):
+        messages = []
+        for i in range(count):
+            if rng.random() < .5:
+                messages.append(('trigger?name=event{}&value={}'.format(i, rng.randint(0, 1000)).encode(), None))
+            else:
+                # payloads contain newlines and anything else
+                payload = os.urandom(rng.choice((0, 1, 7, 8192, rng.randint(0, 20000))))
+                messages.append(('dmd_frame?name=dmd{}'.format(i).encode(), payload))
+        return messages
+
+    @staticmethod
+    def _encode(messages):
+        return b''.join(message + b'\n' if payload is None else
+                        message + b'&bytes=' + str(len(payload)).encode() + b'\n' + payload
+                        for message, payload in messages)
+
+    def _parse(self, rng, data, use_buffer):
+        parser = self._create_parser()
+        received = []
+        position = 0
+        while position < len(data):
+            if use_buffer and parser.payload_remaining:
+                # like recv_into
+                buffer = parser.payload_buffer
+                count = min(len(buffer), rng.randint(1, 5000), len(data) - position)
+                buffer[:count] = data[position:position + count]
+                position += count
+                received.extend(parser.advance_payload(count))
+                continue
+
+            count = rng.randint(1, 9000)
+            received.extend(parser.feed(data[position:position + count]))
+            position += count
+
+        self.assertEqual(0, parser.payload_remaining)
+        return received
+
+    def test_fuzz(self):
+        for seed in range(50):
+            rng = random.Random(seed)
+            messages = self._random_messages(rng, rng.randint(1, 30))
+            data = self._encode(messages)
+
+            for use_buffer in (False, True):
+                received = self._parse(rng, data, use_buffer)
+                self.assertEqual(len(messages), len(received))
+                for (message, payload), (received_message, received_payload) in zip(messages, received):
+                    self.assertEqual(message, received_message)
+                    if payload is None:
+                        self.assertIsNone(received_payload)
+                    else:
+                        self.assertIsInstance(received_payload, memoryview)
+                        self.assertEqual(payload, received_payload)
+
+    def test_empty_lines_and_whitespace(self):
+        parser = self._create_parser()
+        self.assertEqual([(b'hello?version=1.1', None)], parser.feed(b'\n\r\nhello?version=1.1\r\n\n'))
+
+    def test_invalid_length(self):
+        parser = self._create_parser()
+        with self.assertLogs('test', logging.WARNING):
+            self.assertEqual([(b'trigger?name=test', None)],
+                             parser.feed(b'dmd_frame?name=dmd&bytes=abc\ndmd_frame?name=dmd&bytes=-1\n'
+                                         b'trigger?name=test\n'))
+        self.assertEqual(0, parser.payload_remaining)
+
+    def test_max_message_size(self):
+        parser = self._create_parser(max_message_size=100)
+        with self.assertLogs('test', logging.WARNING):
+            # the payload is skipped without allocating a buffer for it
+            self.assertEqual([], parser.feed(b'dmd_frame?name=dmd&bytes=1000\n' + b'\n' * 600))
+            self.assertEqual(0, parser.payload_remaining)
+            self.assertEqual([(b'trigger?name=test', None)], parser.feed(b'\n' * 400 + b'trigger?name=test\n'))
+
+        with self.assertLogs('test', logging.WARNING):
+            # a message without newline is not buffered
+            self.assertEqual([], parser.feed(b'x' * 150))
+            self.assertEqual([(b'trigger?name=test', None)], parser.feed(b'x' * 150 + b'\ntrigger?name=test\n'))
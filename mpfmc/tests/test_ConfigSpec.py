@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import MagicMock
+
+from mpf.core.config_validator import ConfigValidator
+from mpf.exceptions.config_file_error import ConfigFileError
+
+from mpfmc.core.config_spec import add_mc_config_spec
+
+
+class TestConfigSpec(unittest.TestCase):
+
+    def setUp(self):
+        self.config_spec = {'dmds': {'__valid_in__': 'machine',
+                                     '__type__': 'device',
+                                     'fps': ['single', 'int', '30']},
+                            'rgb_dmds': {'__valid_in__': 'machine',
+                                         '__type__': 'device',
+                                         'fps': ['single', 'int', '30']},
+                            'display_light_player': {'__valid_in__': 'machine, mode, show',
+                                                     '__type__': 'config_player',
+                                                     'action': ['single', 'enum(play,stop)', 'play']}}
+        add_mc_config_spec(self.config_spec)
+        self.validator = ConfigValidator(MagicMock(), self.config_spec)
+
+    def test_dmd_settings(self):
+        config = self.validator.validate_config('dmds', {'gpu_conversion': True, 'async_readback': True})
+        self.assertTrue(config['gpu_conversion'])
+        self.assertTrue(config['async_readback'])
+        self.assertEqual(30, config['fps'])
+
+        config = self.validator.validate_config('dmds', {'packed': True, 'shared_capture': True})
+        self.assertTrue(config['packed'])
+        self.assertTrue(config['shared_capture'])
+        self.assertFalse(config['gpu_conversion'])
+
+    def test_rgb_dmd_settings(self):
+        config = self.validator.validate_config('rgb_dmds', {'async_readback': True, 'persistent_render': True})
+        self.assertTrue(config['async_readback'])
+        self.assertTrue(config['persistent_render'])
+        self.assertNotIn('gpu_conversion', config)
+
+    def test_shared_memory_settings(self):
+        for section in ('dmds', 'rgb_dmds'):
+            config = self.validator.validate_config(section, {'shared_memory_path': '/dev/shm/dmd',
+                                                              'shared_memory_slots': 8})
+            self.assertEqual('/dev/shm/dmd', config['shared_memory_path'])
+            self.assertEqual(8, config['shared_memory_slots'])
+
+            config = self.validator.validate_config(section, {})
+            self.assertIsNone(config['shared_memory_path'])
+            self.assertEqual(4, config['shared_memory_slots'])
+
+    def test_display_light_player_settings(self):
+        config = self.validator.validate_config('display_light_player', {'readback': 'light_map',
+                                                                          'sample_radius': 2})
+        self.assertEqual('light_map', config['readback'])
+        self.assertEqual(2, config['sample_radius'])
+        self.assertEqual('full', self.validator.validate_config('display_light_player', {})['readback'])
+
+        with self.assertRaises(ConfigFileError):
+            self.validator.validate_config('display_light_player', {'readback': 'unknown'})
+
+    def test_settings_of_mpf_are_kept(self):
+        config_spec = {'dmds': {'gpu_conversion': ['single', 'bool', 'true']}}
+        add_mc_config_spec(config_spec)
+        self.assertEqual(['single', 'bool', 'true'], config_spec['dmds']['gpu_conversion'])
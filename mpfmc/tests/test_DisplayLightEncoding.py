@@ -0,0 +1,20 @@
+import unittest
+
+from mpfmc.core.display_light_encoding import decode_light_batch, encode_light_batch
+
+
+class TestDisplayLightEncoding(unittest.TestCase):
+
+    def test_encode_decode(self):
+        groups = [("show_lights", "window", [(0, (255, 128, 0)), (3, -1)]),
+                  ("mode_base", "dmd", []),
+                  ("mode_ünicode", "dmd", [(65535, (0, 0, 0))])]
+        data = encode_light_batch(groups)
+        self.assertEqual(groups, decode_light_batch(data))
+        self.assertEqual(groups, decode_light_batch(memoryview(data)))
+
+    def test_compact(self):
+        changes = [(index, (index % 256, 0, 0)) for index in range(1000)]
+        data = encode_light_batch([("show_lights", "window", changes)])
+        # six bytes per light plus the header
+        self.assertEqual(6 + len("show_lights") + len("window") + 6 * 1000, len(data))
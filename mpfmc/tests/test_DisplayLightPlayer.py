@@ -0,0 +1,79 @@
+from mpfmc.tests.MpfMcTestCase import MpfMcTestCase
+
+
+class TestDisplayLightPlayer(MpfMcTestCase):
+    def get_machine_path(self):
+        return 'tests/machine_files/dmd'
+
+    def get_config_file(self):
+        return 'test_dmd.yaml'
+
+    def _play(self, action, readback='full', sample_radius=0):
+        self.mc.display_light_player.play_element(
+            settings=dict(action=action, light_map=[(0.5, 0.5, "light1")], readback=readback,
+                          sample_radius=sample_radius),
+            element="dmd", context="_global", calling_context=None)
+
+    def test_idle_display_is_not_read_back(self):
+        capture = self.mc.get_display_capture(self.mc.displays["dmd"])
+        self.mc.events.post('dmd_slide')
+        self.advance_time()
+
+        self._play("play")
+        self.advance_time()
+        self.assertGreater(capture.readbacks, 0)
+
+        # nothing changes on the display
+        readbacks = capture.readbacks
+        self.advance_time(1)
+        self.assertEqual(readbacks, capture.readbacks)
+
+        # the display changed
+        self.mc.events.post('container_slide')
+        self.advance_time()
+        self.assertGreater(capture.readbacks, readbacks)
+        triggers = [cmd for cmd in self.sent_bcp_commands
+                    if cmd[0] == "trigger" and cmd[2].get("name") == "display_light_player_apply"]
+        self.assertTrue(triggers)
+        self.assertEqual("dmd", triggers[-1][2]["element"])
+
+        # stopped players do not read back
+        self._play("stop")
+        readbacks = capture.readbacks
+        self.mc.events.post('dmd_slide')
+        self.advance_time(1)
+        self.assertEqual(readbacks, capture.readbacks)
+
+        # play again
+        self._play("play")
+        self.advance_time()
+        self.assertGreater(capture.readbacks, readbacks)
+
+        self.mc.display_light_player.clear_context("_global")
+        readbacks = capture.readbacks
+        self.mc.events.post('container_slide')
+        self.advance_time(1)
+        self.assertEqual(readbacks, capture.readbacks)
+
+    def test_light_map_readback(self):
+        capture = self.mc.get_display_capture(self.mc.displays["dmd"])
+        self.mc.events.post('dmd_slide')
+        self.advance_time()
+
+        # only the pixel of the single light is read back
+        self._play("play", readback='light_map')
+        self.advance_time()
+        self.assertGreater(capture.readbacks, 0)
+        self.assertEqual((64, 16, 1, 1), capture.region)
+
+    def test_sample_radius(self):
+        self.mc.events.post('dmd_slide')
+        self.advance_time()
+
+        self._play("play", sample_radius=2)
+        self.advance_time()
+        # lights are sampled from the averaged capture
+        capture = self.mc.get_display_capture(self.mc.displays["dmd"], 2)
+        self.assertEqual(2, capture.average_radius)
+        self.assertGreater(capture.readbacks, 0)
+        self.assertNotIn(("dmd", 0), self.mc.display_captures)
@@ -1,3 +1,12 @@
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+
+from mpfmc.core import dmd
+from mpfmc.core.dmd import Dmd, RgbDmd
+from mpfmc.core.dmd_encoding import pack_shades, unpack_shades
+from mpfmc.core.dmd_shared_memory import SharedFrameReader
 from mpfmc.tests.MpfSlideTestCase import MpfSlideTestCase
 
 from mpfmc.tests.MpfMcTestCase import MpfMcTestCase
@@ -57,3 +66,184 @@ class TestDmd(MpfMcTestCase, MpfSlideTestCase):
         self.mc.events.post('show_gamma_test')
         self.advance_time(.1)
         self.assertSlideOnTop("dmd_gamma_test")
+
+    def test_convert_to_single_bytes(self):
+        data = bytes(range(256)) * 3 + bytes([255, 255, 255, 0, 0, 0, 127, 128, 129])
+        config = dict(luminosity=[.299, .587, .114])
+
+        expected = Dmd._convert_to_single_bytes_loop(data, config['luminosity'])
+        self.assertEqual(len(data) // 3, len(expected))
+        self.assertEqual(15, expected[-3])
+        self.assertEqual(0, expected[-2])
+        self.assertEqual(8, expected[-1])
+
+        # vectorized path (if numpy is installed) has to be byte-identical
+        self.assertEqual(expected, Dmd._convert_to_single_bytes(data, config))
+
+        with patch.object(dmd, "numpy", None):
+            self.assertEqual(expected, Dmd._convert_to_single_bytes(data, config))
+
+    def test_convert_to_single_bytes_packed(self):
+        data = bytes(range(256)) * 3 + bytes([255, 255, 255, 0, 0, 0, 127, 128, 129])
+        config = dict(luminosity=[.299, .587, .114], packed=True)
+
+        expected = pack_shades(Dmd._convert_to_single_bytes_loop(data, config['luminosity']), 259)
+        self.assertEqual(130, len(expected))
+        self.assertEqual(expected, Dmd._convert_to_single_bytes(data, config, 259))
+        self.assertEqual(Dmd._convert_to_single_bytes_loop(data, config['luminosity']), unpack_shades(expected, 259))
+
+        with patch.object(dmd, "numpy", None):
+            self.assertEqual(expected, Dmd._convert_to_single_bytes(data, config, 259))
+
+    def test_reorder_channels(self):
+        data = bytes([1, 2, 3, 4, 5, 6])
+
+        self.assertEqual((2, 1, 0), RgbDmd._build_channel_map("bgr"))
+        self.assertEqual(bytes([3, 2, 1, 6, 5, 4]),
+                         RgbDmd._reorder_channels(data, RgbDmd._build_channel_map("bgr")))
+        self.assertEqual(bytes([2, 1, 3, 5, 4, 6]),
+                         RgbDmd._reorder_channels(data, RgbDmd._build_channel_map("grb")))
+
+        with self.assertRaises(ValueError):
+            RgbDmd._build_channel_map("rgx")
+
+    def test_strip_row_padding(self):
+        # 5 pixels wide packed three per pixel -> 2 RGB pixels (6 bytes) per row
+        data = bytes([1, 2, 3, 4, 5, 0, 6, 7, 8, 9, 10, 0])
+        self.assertEqual(bytes([1, 2, 3, 4, 5, 6, 7, 8, 9, 10]), Dmd._strip_row_padding(data, 5, 6))
+        self.assertEqual(data, Dmd._strip_row_padding(data, 6, 6))
+
+    def test_only_send_changes(self):
+        dmd_device = Dmd(self.mc, "test_dmd", dict(source_display="dmd", only_send_changes=True))
+        frame1 = bytes([0, 0, 0]) * 128 * 32
+        frame2 = bytes([255, 255, 255]) * 128 * 32
+
+        dmd_device._process_frame(frame1)
+        dmd_device._process_frame(frame1)
+        dmd_device._process_frame(frame2)
+        dmd_device._process_frame(frame2)
+        dmd_device._process_frame(frame1)
+
+        self.assertEqual(3, dmd_device.sent_frames)
+        self.assertEqual(2, dmd_device.skipped_frames)
+        self.assertEqual(3, len([cmd for cmd in self.sent_bcp_commands if cmd[0] == "dmd_frame"]))
+        self.assertEqual({'sent_frames': 3, 'skipped_frames': 2, 'dropped_frames': 0,
+                          'readback_latency': 0}, dmd_device.get_stats())
+
+    def test_keyframe_for_secondary_client(self):
+        dmd_device = Dmd(self.mc, "test_dmd", dict(source_display="dmd", only_send_changes=True))
+        self.mc.bcp_processor.frame_formats = {'delta'}
+        self.advance_time()
+        sent_frames = dmd_device.sent_frames
+        self.assertGreater(sent_frames, 0)
+
+        # the display is idle
+        self.advance_time(.1)
+        self.assertEqual(sent_frames, dmd_device.sent_frames)
+
+        # a read-only client connected. the current frame is sent as keyframe
+        del self.sent_bcp_commands[:]
+        self.mc.events.post('secondary_client_connected', host="localhost", port=1234)
+        self.advance_time()
+        self.assertEqual(sent_frames + 1, dmd_device.sent_frames)
+        self.assertEqual(["dmd_frame"], [cmd[0] for cmd in self.sent_bcp_commands if cmd[0].startswith("dmd_frame")])
+
+    def test_async_readback(self):
+        dmd_device = Dmd(self.mc, "test_dmd", dict(source_display="dmd", async_readback=True))
+        self.assertEqual(1, dmd_device.readback_latency)
+        drawn = []
+        frames = []
+        dmd_device._draw = lambda: drawn.append(len(drawn))
+        dmd_device._read_pixels = lambda: "frame{}".format(drawn[-1])
+        dmd_device._handle_frame = frames.append
+
+        # frame 0 is drawn in tick 0 but not read back yet
+        dmd_device._dirty = True
+        dmd_device._render(0)
+        self.assertEqual([0], drawn)
+        self.assertEqual([], frames)
+        self.assertTrue(dmd_device._readback_pending)
+
+        # tick 1 reads frame 0 before frame 1 is drawn
+        dmd_device._dirty = True
+        dmd_device._render(0)
+        self.assertEqual([0, 1], drawn)
+        self.assertEqual(["frame0"], frames)
+
+        # the display went idle. the clock still delivers the last frame
+        self.advance_time(.1)
+        self.assertEqual(["frame0", "frame1"], frames[:2])
+
+    def test_persistent_render_idle(self):
+        dmd_device = Dmd(self.mc, "test_dmd", dict(source_display="dmd", persistent_render=True))
+        draw = dmd_device._draw
+        drawn = []
+
+        def _draw():
+            drawn.append(True)
+            draw()
+
+        dmd_device._draw = _draw
+        self.advance_time(.1)
+        self.assertTrue(drawn)
+
+        # drawing the display does not mark it dirty again
+        del drawn[:]
+        self.advance_time(1)
+        self.assertEqual([], drawn)
+
+    def test_shared_memory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "rgb_dmd.frames")
+        dmd_device = RgbDmd(self.mc, "test_dmd", dict(source_display="dmd", shared_memory_path=path,
+                                                      shared_memory_slots=2))
+        self.addCleanup(dmd_device.shared_memory.close)
+        frame = bytes(range(256)) * 48
+
+        # frames are sent via BCP until the client requests shared memory
+        dmd_device.send(frame)
+        self.assertEqual(("rgb_dmd_frame", None, {'rawbytes': frame, 'name': 'test_dmd'}),
+                         self.sent_bcp_commands[-1])
+
+        self.mc.bcp_processor.frame_formats = {'shared_memory'}
+        self.addCleanup(setattr, self.mc.bcp_processor, "frame_formats", set())
+        dmd_device.send(frame)
+        self.assertEqual(("rgb_dmd_frame_shared", None, {'name': 'test_dmd', 'path': path, 'sequence': 1}),
+                         self.sent_bcp_commands[-1])
+
+        reader = SharedFrameReader(path)
+        self.addCleanup(reader.close)
+        self.assertEqual(frame, reader.read(1))
+
+        # the ring buffer is removed when MPF-MC stops
+        dmd_device._close_shared_memory()
+        self.assertFalse(os.path.exists(path))
+
+    def test_shared_capture(self):
+        dmd_device = Dmd(self.mc, "test_dmd", dict(source_display="dmd", shared_capture=True))
+        rgb_dmd_device = RgbDmd(self.mc, "test_rgb_dmd", dict(source_display="dmd", shared_capture=True))
+        self.assertTrue(dmd_device.shared_capture)
+        self.assertTrue(rgb_dmd_device.shared_capture)
+
+        # both DMDs use one readback of the display
+        capture = self.mc.get_display_capture(self.mc.displays["dmd"])
+        self.assertEqual([dmd_device._receive_capture, rgb_dmd_device._receive_capture],
+                         list(capture._subscribers))
+
+    def test_shared_capture_conversion(self):
+        dmd_device = Dmd(self.mc, "test_dmd", dict(source_display="dmd"))
+        width, height = self.mc.displays["dmd"].native_size
+        # RGBA with the bottom row first. bottom row is white and everything else red
+        frame = bytes([255, 255, 255, 255]) * width + bytes([255, 0, 0, 255]) * width * (height - 1)
+
+        data = dmd_device._convert_capture(memoryview(frame))
+        self.assertEqual(bytes([255, 0, 0]) * width * (height - 1) + bytes([255, 255, 255]) * width, data)
+
+        with patch.object(dmd, "numpy", None):
+            self.assertEqual(data, dmd_device._convert_capture(memoryview(frame)))
+
+        self.assertIsNone(Dmd._build_color_table(1.0, 1.0))
+        table = Dmd._build_color_table(0.5, 1.0)
+        self.assertEqual(0, table[0])
+        self.assertEqual(128, table[255])
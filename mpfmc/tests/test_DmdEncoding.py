@@ -0,0 +1,116 @@
+import os
+import queue
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from mpfmc.core import dmd_encoding
+from mpfmc.core.dmd_encoding import DeltaFrameEncoder, DmdEncodingWorker, apply_delta_frame, pack_shades, \
+    unpack_shades
+
+
+class TestDmdEncoding(unittest.TestCase):
+
+    def test_delta_frames(self):
+        rows = 4
+        row_length = 6
+        encoder = DeltaFrameEncoder(rows, keyframe_interval=3)
+        frame1 = bytes(rows * row_length)
+
+        # first frame is always a keyframe
+        self.assertIsNone(encoder.encode(frame1))
+
+        # change row 1 and 2
+        frame2 = bytearray(frame1)
+        frame2[6:18] = b'\x01' * 12
+        frame2 = bytes(frame2)
+        delta = encoder.encode(frame2)
+        self.assertEqual(b'\x00\x01\x00\x02' + b'\x01' * 12, delta)
+        self.assertEqual(frame2, bytes(apply_delta_frame(bytearray(frame1), delta, row_length)))
+
+        # change row 0 and 3
+        frame3 = bytearray(frame2)
+        frame3[0] = 5
+        frame3[23] = 7
+        frame3 = bytes(frame3)
+        delta = encoder.encode(frame3)
+        self.assertEqual(2 * 4 + 2 * row_length, len(delta))
+        self.assertEqual(frame3, bytes(apply_delta_frame(bytearray(frame2), delta, row_length)))
+
+        # nothing changed
+        self.assertEqual(b'', encoder.encode(frame3))
+
+        # keyframe interval reached
+        self.assertIsNone(encoder.encode(frame3))
+        self.assertEqual(b'', encoder.encode(frame3))
+
+        # everything changed. keyframe is smaller
+        self.assertIsNone(encoder.encode(bytes([9]) * rows * row_length))
+
+        # e.g. for a client which connected later
+        encoder.request_keyframe()
+        self.assertIsNone(encoder.encode(bytes([9]) * rows * row_length))
+        self.assertEqual(b'', encoder.encode(bytes([9]) * rows * row_length))
+
+    def test_delta_frames_random(self):
+        rows = 32
+        row_length = 128
+        encoder = DeltaFrameEncoder(rows, keyframe_interval=1000)
+        frame = bytearray(os.urandom(rows * row_length))
+        client_frame = bytearray(frame)
+        self.assertIsNone(encoder.encode(bytes(frame)))
+
+        for i in range(100):
+            row = (i * 7) % rows
+            frame[row * row_length:(row + 1) * row_length] = os.urandom(row_length)
+            delta = encoder.encode(bytes(frame))
+            self.assertLess(len(delta), len(frame))
+            apply_delta_frame(client_frame, delta, row_length)
+            self.assertEqual(frame, client_frame)
+
+    def test_pack_shades(self):
+        self.assertEqual(bytes([0x12, 0x3F]), pack_shades(bytes([1, 2, 3, 15]), 4))
+        # odd width pads every row
+        self.assertEqual(bytes([0x12, 0x30, 0x45, 0x60]), pack_shades(bytes([1, 2, 3, 4, 5, 6]), 3))
+
+        with patch.object(dmd_encoding, "numpy", None):
+            self.assertEqual(bytes([0x12, 0x3F]), pack_shades(bytes([1, 2, 3, 15]), 4))
+            self.assertEqual(bytes([0x12, 0x30, 0x45, 0x60]), pack_shades(bytes([1, 2, 3, 4, 5, 6]), 3))
+
+        self.assertEqual(bytes([1, 2, 3, 15]), unpack_shades(bytes([0x12, 0x3F]), 4))
+        self.assertEqual(bytes([1, 2, 3, 4, 5, 6]), unpack_shades(bytes([0x12, 0x30, 0x45, 0x60]), 3))
+
+        for width, height in ((128, 32), (5, 3)):
+            frame = bytes(value % 16 for value in os.urandom(width * height))
+            packed = pack_shades(frame, width)
+            self.assertEqual((width + 1) // 2 * height, len(packed))
+            self.assertEqual(frame, unpack_shades(packed, width))
+
+    def test_encoding_worker(self):
+        mc = MagicMock()
+        mc.thread_stopper = threading.Event()
+        mc.crash_queue = queue.Queue()
+        dmd1 = MagicMock(dropped_frames=0)
+        dmd2 = MagicMock(dropped_frames=0)
+
+        worker = DmdEncodingWorker(mc)
+        # the worker is not running yet so frames are pending and stale ones are dropped
+        worker.submit(dmd1, b'1')
+        worker.submit(dmd2, b'A')
+        worker.submit(dmd1, b'2')
+        worker.submit(dmd1, b'3')
+        self.assertEqual(2, dmd1.dropped_frames)
+        self.assertEqual(0, dmd2.dropped_frames)
+
+        worker.start()
+        for _ in range(100):
+            if dmd1._process_frame.called and dmd2._process_frame.called:
+                break
+            time.sleep(.01)
+        mc.thread_stopper.set()
+        worker.join()
+
+        dmd1._process_frame.assert_called_once_with(b'3')
+        dmd2._process_frame.assert_called_once_with(b'A')
+        self.assertTrue(mc.crash_queue.empty())
@@ -0,0 +1,64 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from mpfmc.core.dmd_shared_memory import SharedFrameReader, SharedFrameWriter, SLOT_HEADER
+
+
+class TestDmdSharedMemory(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "dmd.frames")
+        self.writer = SharedFrameWriter(self.path, slots=3, slot_size=16)
+        self.addCleanup(self.writer.close)
+        self.reader = SharedFrameReader(self.path)
+        self.addCleanup(self.reader.close)
+
+    def test_ring_buffer(self):
+        self.assertEqual(3, self.reader.slots)
+        self.assertEqual(16, self.reader.slot_size)
+        # nothing has been written yet
+        self.assertIsNone(self.reader.read(1))
+
+        self.assertEqual(1, self.writer.write(b'frame1'))
+        self.assertEqual(2, self.writer.write(b'\x00' * 16))
+        self.assertEqual(b'frame1', self.reader.read(1))
+        self.assertEqual(b'\x00' * 16, self.reader.read(2))
+
+        # frame 1 and 2 are overwritten after three newer frames
+        for sequence in range(3, 6):
+            self.assertEqual(sequence, self.writer.write(bytes([sequence]) * sequence))
+        self.assertIsNone(self.reader.read(1))
+        self.assertIsNone(self.reader.read(2))
+        for sequence in range(3, 6):
+            self.assertEqual(bytes([sequence]) * sequence, self.reader.read(sequence))
+
+    def test_close_and_remove(self):
+        self.writer.close(remove=True)
+        self.assertFalse(os.path.exists(self.path))
+        # a reader which mapped the file keeps working
+        self.assertIsNone(self.reader.read(1))
+
+    def test_frame_too_large(self):
+        with self.assertRaises(ValueError):
+            self.writer.write(b'\x00' * 17)
+
+    def test_torn_frame(self):
+        self.writer.write(b'frame1')
+        # a slot which is being written has sequence 0
+        with open(self.path, "r+b") as f:
+            f.seek(struct.calcsize('<4sHHI') + SLOT_HEADER.size + 16)
+            f.write(SLOT_HEADER.pack(0, 0))
+            f.flush()
+        self.assertIsNone(self.reader.read(1))
+
+    def test_invalid_file(self):
+        path = self.path + ".invalid"
+        with open(path, "wb") as f:
+            f.write(b'\x00' * 64)
+        with self.assertRaises(ValueError):
+            SharedFrameReader(path)
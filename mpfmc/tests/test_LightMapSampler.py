@@ -0,0 +1,49 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from mpfmc.config_players import display_light_player
+from mpfmc.config_players.display_light_player import LightMapSampler
+
+
+class TestLightMapSampler(unittest.TestCase):
+
+    def _crop(self, frame, width, region):
+        x, y, region_width, region_height = region
+        return b''.join(frame[((y + row) * width + x) * 4:((y + row) * width + x + region_width) * 4]
+                        for row in range(region_height))
+
+    def _test_sample(self):
+        width = 200
+        height = 100
+        light_map = [(0.3, 0.4, "l1"), (0.5, 0.9, "l2"), (0.7, 0.5, "l3"), (1.0, 0.01, "l4")]
+        frame = bytearray(os.urandom(width * height * 4))
+        # all pixels are opaque
+        frame[3::4] = b'\xff' * (width * height)
+        # make l1 transparent
+        frame[(width * 60 + 60) * 4 + 3] = 0
+
+        sampler = LightMapSampler(light_map, width, height)
+        values = sampler.sample(frame)
+        self.assertEqual(-1, values["l1"])
+        self.assertEqual(tuple(frame[(width * 10 + 100) * 4:(width * 10 + 100) * 4 + 3]), values["l2"])
+        # lights on the edge are clamped to the display
+        self.assertEqual(tuple(frame[(width * 99 + 199) * 4:(width * 99 + 199) * 4 + 3]), values["l4"])
+
+        # nothing changed
+        self.assertEqual({}, sampler.sample(frame))
+
+        # only the bounding box of the lights is read back
+        region = sampler.bounding_box
+        self.assertEqual((60, 10, 140, 90), region)
+        sampler.set_region(region)
+        frame[(width * 50 + 140) * 4] ^= 0xFF
+        values = sampler.sample(self._crop(frame, width, region))
+        self.assertEqual({"l3": tuple(frame[(width * 50 + 140) * 4:(width * 50 + 140) * 4 + 3])}, values)
+
+    def test_sample(self):
+        self._test_sample()
+
+    def test_sample_without_numpy(self):
+        with patch.object(display_light_player, "numpy", None):
+            self._test_sample()